@@ -1,54 +1,176 @@
 # app.py
 
 import os
-import io
+import sys
 import tempfile
 import time
 import re
 import math
-from datetime import datetime, timezone
-from functools import lru_cache
+import random
+import collections
+import heapq
+import json
+import pickle
+import hashlib
+import sqlite3
+import threading
+import queue
+import uuid
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from urllib.error import HTTPError
+from urllib.parse import quote, unquote, urlsplit, urlunsplit, parse_qs, parse_qsl, urlencode
 
 from flask import (
     Flask, request, send_file, render_template,
-    jsonify, redirect, abort
+    jsonify, redirect, Response, stream_with_context
 )
 from flask.logging import create_logger
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError as GoogleHttpError
-from pytubefix import YouTube
-from faster_whisper import WhisperModel
+import click
+import transcriber
+# googleapiclient, pytubefix, faster_whisper는 무거우므로 필요한 엔드포인트에서 처음 쓸 때 import한다.
+# ('/'만 처리하는 워커가 ctranslate2/onnxruntime까지 올리지 않도록. bench_startup.py로 확인)
 
 # --- Flask 앱 설정 ---
 app = Flask(__name__)
 logger = create_logger(app)
 
+@app.template_filter('comma')
+def comma(n):
+    return f"{n:,}"
+
 # --- 환경 변수 및 설정 ---
-API_KEY = os.getenv("YOUTUBE_API_KEY")
-if not API_KEY:
-    raise RuntimeError("YOUTUBE_API_KEY 환경 변수 필요")
+# 여러 키를 쓰려면 YOUTUBE_API_KEYS="키1,키2:2,키3" (":숫자"는 가중치, 기본 1)
+def parse_api_keys(raw):
+    keys = []
+    for item in (raw or "").split(","):
+        key, _, weight = item.strip().partition(":")
+        if key: keys.append((key, int(weight or 1)))
+    return keys
+
+API_KEYS = parse_api_keys(os.getenv("YOUTUBE_API_KEYS") or os.getenv("YOUTUBE_API_KEY"))
+if not API_KEYS:
+    raise RuntimeError("YOUTUBE_API_KEY 또는 YOUTUBE_API_KEYS 환경 변수 필요")
+
+try:
+    import fcntl
+except ImportError:  # Windows 개발 환경
+    fcntl = None
 
 CPM_USD = float(os.getenv("CPM_USD", 1.5))
 DEBUG = os.getenv("FLASK_DEBUG", "false").lower() == "true"
 
-# --- Whisper 모델 Lazy-Load 및 영구 저장소 사용 ---
-WHISPER_MODEL = None
-def get_whisper_model():
-    global WHISPER_MODEL
-    if WHISPER_MODEL is None:
-        logger.info("Whisper 모델을 로드하는 중입니다...")
-        try:
-            # Render의 영구 디스크 경로를 사용
-            cache_directory = "/var/data/whisper_cache"
-            if not os.path.exists(cache_directory):
-                os.makedirs(cache_directory)
-            WHISPER_MODEL = WhisperModel('base', device='cpu', compute_type="int8", download_root=cache_directory)
-            logger.info("Whisper 모델 로드 완료.")
-        except Exception as e:
-            logger.error(f"Whisper 모델 로드 실패: {e}")
-            WHISPER_MODEL = False # 실패했음을 명확히 표시
-    return WHISPER_MODEL
+# Render의 영구 디스크 경로 (캐시 DB, 모델 등)
+DATA_DIR = os.getenv("DATA_DIR", "/var/data")
+CACHE_DB = os.getenv("CACHE_DB", os.path.join(DATA_DIR, "youtube_cache.sqlite3"))
+CHANNEL_CACHE_TTL = int(os.getenv("CHANNEL_CACHE_TTL", 3600))  # 초
+MAX_VIDEOS = int(os.getenv("MAX_VIDEOS", 200))
+# 증분 동기화: 이미 아는 영상에서 페이징을 멈추고 최근 영상 통계만 새로 받는다
+INCREMENTAL_SYNC = os.getenv("INCREMENTAL_SYNC", "true").lower() == "true"
+SYNC_REFRESH_RECENT = int(os.getenv("SYNC_REFRESH_RECENT", 50))
+FULL_SYNC_TTL = int(os.getenv("FULL_SYNC_TTL", 7 * 86400))  # 이 주기마다 전체 목록을 다시 받는다
+CHANNEL_INDEX_TTL = int(os.getenv("CHANNEL_INDEX_TTL", 30 * 86400))  # 핸들/사용자명 → 채널 ID 매핑 보관 기간
+# ETag 재검증용으로 저장한 응답 보관 기간. videos.list 배치처럼 키가 자주 바뀌는 응답이 쌓이지 않도록 지난 것은 지운다
+API_ETAG_TTL = int(os.getenv("API_ETAG_TTL", 7 * 86400))
+CHANNEL_REFRESH_WAIT = int(os.getenv("CHANNEL_REFRESH_WAIT", 60))  # 다른 프로세스의 같은 채널 갱신을 기다리는 한도(초)
+# videos.list 배치 병렬 호출: 전체 워커 수와 API 키당 동시 요청 수 상한
+API_WORKERS = int(os.getenv("API_WORKERS", 8))
+API_KEY_CONCURRENCY = int(os.getenv("API_KEY_CONCURRENCY", 4))
+YOUTUBE_CLIENT_POOL_SIZE = int(os.getenv("YOUTUBE_CLIENT_POOL_SIZE", 8))  # 재사용할 유휴 클라이언트 수
+# Data API 할당량: 키당 하루 한도(태평양 시간 자정에 초기화). 남은 양이 LOW 아래로 내려가면
+# 오래된 캐시를 그대로 쓰고 새로 받는 영상 수를 줄인다
+QUOTA_DAILY_LIMIT = int(os.getenv("QUOTA_DAILY_LIMIT", 10000))
+QUOTA_LOW_WATERMARK = int(os.getenv("QUOTA_LOW_WATERMARK", 1000))
+QUOTA_DEGRADED_MAX_VIDEOS = int(os.getenv("QUOTA_DEGRADED_MAX_VIDEOS", 50))
+# 재시도 정책 (pytubefix, Data API 공용): 시도 횟수, 백오프 기준/상한(초), 1분당 재시도 예산,
+# 연속 실패가 BREAKER_THRESHOLD번이면 BREAKER_COOLDOWN초 동안 바로 실패시킨다
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", 4))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 8))
+RETRY_BUDGET_PER_MIN = int(os.getenv("RETRY_BUDGET_PER_MIN", 30))
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))
+# 비워 두면 googleapiclient 패키지에 포함된 youtube.v3.json을 쓴다
+YOUTUBE_DISCOVERY_DOC = os.getenv("YOUTUBE_DISCOVERY_DOC", "")
+
+# 자막 캐시: 찾은 자막은 오래, '자막 없음' 결과는 짧게 보관한다
+CAPTION_CACHE_TTL = int(os.getenv("CAPTION_CACHE_TTL", 7 * 86400))
+CAPTION_NEGATIVE_TTL = int(os.getenv("CAPTION_NEGATIVE_TTL", 600))
+CAPTION_LANGS = ('ko', 'en', 'a.en')  # 앞에서부터 찾는다
+
+# 영상 다운로드 스트리밍: YouTube에는 DOWNLOAD_RANGE_SIZE 단위로 요청하고(큰 범위는 속도 제한),
+# 클라이언트에는 DOWNLOAD_CHUNK_SIZE 단위로 바로 흘려보내 다운로드당 메모리를 일정하게 유지한다
+DOWNLOAD_RANGE_SIZE = int(os.getenv("DOWNLOAD_RANGE_SIZE", 9 * 1024 * 1024))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 256 * 1024))
+# 다 받은 영상은 디스크에 캐시해 sendfile로 보낸다. 전체 크기가 상한을 넘으면 오래 안 쓴 것부터 지운다
+VIDEO_CACHE_DIR = os.getenv("VIDEO_CACHE_DIR", os.path.join(DATA_DIR, "video_cache"))
+VIDEO_CACHE_MAX_BYTES = int(os.getenv("VIDEO_CACHE_MAX_BYTES", 5 * 1024**3))
+# 다른 요청이 시작한 다운로드가 준비되기를, 또는 멈춘 다운로드가 다시 진행되기를 기다리는 한도(초)
+DOWNLOAD_WAIT_TIMEOUT = int(os.getenv("DOWNLOAD_WAIT_TIMEOUT", 60))
+
+# AI 자막 작업 풀: 웹 워커와 분리된 프로세스가 Whisper 모델을 들고 작업 큐를 처리한다
+WHISPER_CACHE_DIR = os.path.join(DATA_DIR, "whisper_cache")
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", 1))
+TRANSCRIBE_QUEUE_MAX = int(os.getenv("TRANSCRIBE_QUEUE_MAX", 20))  # 대기 작업이 이보다 많으면 503
+TRANSCRIBE_QUEUE_MAX_PER_CLIENT = int(os.getenv("TRANSCRIBE_QUEUE_MAX_PER_CLIENT", 5))  # 한 클라이언트의 대기 작업 상한(429)
+# 이 시간 동안 아무도 작업을 지켜보지 않으면(SSE 연결, 상태 조회, /get-caption-ai 대기) 대기/실행 중이어도 취소한다
+TRANSCRIBE_ABANDON_SEC = int(os.getenv("TRANSCRIBE_ABANDON_SEC", 60))
+TRANSCRIBE_WAIT_TIMEOUT = int(os.getenv("TRANSCRIBE_WAIT_TIMEOUT", 600))  # /get-caption-ai 동기 대기 한도(초)
+TRANSCRIBE_JOB_TTL = int(os.getenv("TRANSCRIBE_JOB_TTL", 86400))  # 끝난 작업 기록 보관 기간(초)
+# 전사 프리셋(tier). 요청의 tier 파라미터로 고르고, 없으면 TRANSCRIBE_DEFAULT_TIER를 쓴다.
+# model은 tiny/base/small/medium 등, beam_size=1은 greedy 디코딩. cpu_threads=0이면 CTranslate2 기본값,
+# num_workers는 한 모델 인스턴스로 동시에 돌릴 수 있는 전사 수. TRANSCRIBE_TIERS(JSON)로 tier별 값을 덮어쓰거나 추가한다.
+# 결과에 영향을 주는 옵션(model, compute_type, language, beam_size)은 결과 캐시 키에 들어간다
+TRANSCRIBE_LANGUAGE = os.getenv("TRANSCRIBE_LANGUAGE", "ko")
+# 풀 프로세스가 여럿이면 코어를 나눠 쓰도록 프로세스당 스레드 수를 정한다 (0이면 CTranslate2 기본값)
+# VAD를 켠 tier는 BatchedInferencePipeline으로 한 영상의 음성 구간들을 이만큼씩 묶어 디코딩한다 (0이면 순차 디코딩).
+# 배치 파이프라인은 VAD 구간으로 오디오를 나누므로 VAD를 끈 tier에서는 쓰지 않는다 (30초가 넘는 오디오는 오류가 난다)
+TRANSCRIBE_BATCH_SIZE = int(os.getenv("TRANSCRIBE_BATCH_SIZE", 8))
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS",
+                                    max((os.cpu_count() or 1) // TRANSCRIBE_WORKERS, 1) if TRANSCRIBE_WORKERS > 1 else 0))
+# 이보다 긴 영상은 무음 구간에서 약 TRANSCRIBE_CHUNK_SEC초 조각으로 나눠 풀 프로세스들이 동시에 전사한다
+# (TRANSCRIBE_WORKERS가 1이면 나누지 않는다). 0이면 끈다
+TRANSCRIBE_CHUNK_SEC = int(os.getenv("TRANSCRIBE_CHUNK_SEC", 600))
+TRANSCRIBE_CHUNK_MIN_SEC = int(os.getenv("TRANSCRIBE_CHUNK_MIN_SEC", 1200))
+# VAD(faster-whisper의 Silero VAD)로 음성 구간만 디코딩한다. 무음/인트로/배경음악이 긴 영상일수록 빨라진다 (bench_vad.py).
+# 기본값은 faster-whisper와 같다. threshold가 높을수록 음성으로 보는 기준이 엄격하다
+TRANSCRIBE_VAD = os.getenv("TRANSCRIBE_VAD", "false").lower() == "true"
+VAD_PARAMETERS = {
+    "threshold": float(os.getenv("VAD_THRESHOLD", 0.5)),
+    "min_speech_duration_ms": int(os.getenv("VAD_MIN_SPEECH_MS", 0)),
+    "min_silence_duration_ms": int(os.getenv("VAD_MIN_SILENCE_MS", 2000)),
+    "speech_pad_ms": int(os.getenv("VAD_SPEECH_PAD_MS", 400)),
+}
+TRANSCRIBE_TIERS = {
+    "fast": {"model": "tiny", "compute_type": "int8", "beam_size": 1},
+    "balanced": {"model": "base", "compute_type": "int8", "beam_size": 5},
+    "accurate": {"model": "small", "compute_type": "int8", "beam_size": 5},
+}
+for _tier, _override in json.loads(os.getenv("TRANSCRIBE_TIERS", "{}")).items():
+    TRANSCRIBE_TIERS[_tier] = dict(TRANSCRIBE_TIERS.get(_tier, TRANSCRIBE_TIERS["balanced"]), **_override)
+for _opts in TRANSCRIBE_TIERS.values():
+    _opts.setdefault("language", TRANSCRIBE_LANGUAGE)
+    _opts.setdefault("cpu_threads", WHISPER_CPU_THREADS)
+    _opts.setdefault("num_workers", 1)
+    _opts.setdefault("vad_filter", TRANSCRIBE_VAD)
+    _opts.setdefault("batch_size", TRANSCRIBE_BATCH_SIZE)
+    if not _opts["vad_filter"]: _opts["batch_size"] = 0
+    _opts["vad_parameters"] = dict(VAD_PARAMETERS, **_opts.get("vad_parameters", {}))
+TRANSCRIBE_DEFAULT_TIER = os.getenv("TRANSCRIBE_DEFAULT_TIER", "balanced")
+TRANSCRIBE_OPTIONS = TRANSCRIBE_TIERS[TRANSCRIBE_DEFAULT_TIER]
+# 풀 프로세스가 뜨자마자 백그라운드에서 미리 로드할 tier의 모델 (쉼표로 구분, 비우면 첫 요청 때 로드)
+WHISPER_PREWARM = [t.strip() for t in os.getenv("WHISPER_PREWARM", TRANSCRIBE_DEFAULT_TIER).split(",")
+                   if t.strip() in TRANSCRIBE_TIERS]
+WHISPER_LOAD_RETRY_BASE = float(os.getenv("WHISPER_LOAD_RETRY_BASE", 30))  # 모델 로드 실패 후 첫 재시도까지(초), 실패마다 두 배
+WHISPER_LOAD_RETRY_MAX = float(os.getenv("WHISPER_LOAD_RETRY_MAX", 600))
+# 워커가 뜰 때 디스패처(와 모델 예열)를 바로 시작한다. gunicorn --preload에서는 마스터가 스레드를 띄우지 않도록 끌 것
+TRANSCRIBE_START_AT_BOOT = os.getenv("TRANSCRIBE_START_AT_BOOT", "true").lower() == "true"
+# AI 자막 결과 캐시: 전체 SRT 크기 상한(LRU로 제거). 모델/라이브러리를 바꿔 결과를 모두 버리려면 버전을 올린다
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+TRANSCRIPT_CACHE_VERSION = os.getenv("TRANSCRIPT_CACHE_VERSION", "1")
 
 # --- 유틸리티 함수들 ---
 def parse_iso_date(iso_str):
@@ -74,83 +196,822 @@ def format_seconds(sec):
     if s or not parts: parts.append(f"{s}초")
     return " ".join(parts)
 
-@lru_cache()
-def get_youtube_client():
-    return build("youtube", "v3", developerKey=API_KEY)
+# --- 디스크 캐시 (SQLite) ---
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_etags (
+    key TEXT PRIMARY KEY, etag TEXT NOT NULL, body TEXT NOT NULL, updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS api_etags_age ON api_etags (updated_at);
+CREATE TABLE IF NOT EXISTS transcribe_jobs (
+    id TEXT PRIMARY KEY, video_id TEXT NOT NULL, status TEXT NOT NULL,
+    title TEXT, srt TEXT, error TEXT, error_code INTEGER,
+    created_at REAL NOT NULL, finished_at REAL, options TEXT, client TEXT, last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS transcribe_jobs_status ON transcribe_jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS transcribe_cues (
+    job_id TEXT NOT NULL, idx INTEGER NOT NULL, cue TEXT NOT NULL, PRIMARY KEY (job_id, idx)
+);
+CREATE TABLE IF NOT EXISTS transcripts (
+    key TEXT PRIMARY KEY, video_id TEXT NOT NULL, options TEXT NOT NULL, version TEXT NOT NULL,
+    title TEXT NOT NULL, srt TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_lru ON transcripts (last_access);
+CREATE TABLE IF NOT EXISTS captions (
+    video_id TEXT NOT NULL, langs TEXT NOT NULL, lang TEXT, title TEXT, srt TEXT, fetched_at REAL NOT NULL,
+    PRIMARY KEY (video_id, langs)
+);
+CREATE TABLE IF NOT EXISTS video_cache (
+    video_id TEXT PRIMARY KEY, itag INTEGER NOT NULL, title TEXT NOT NULL, path TEXT NOT NULL,
+    size INTEGER NOT NULL, last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channel_index (
+    kind TEXT NOT NULL, value TEXT NOT NULL, channel_id TEXT NOT NULL, resolved_at REAL NOT NULL,
+    PRIMARY KEY (kind, value)
+);
+CREATE TABLE IF NOT EXISTS quota_usage (
+    key_id TEXT NOT NULL, day TEXT NOT NULL, units INTEGER NOT NULL, calls INTEGER NOT NULL,
+    PRIMARY KEY (key_id, day)
+);
+CREATE TABLE IF NOT EXISTS channel_snapshots (
+    channel_id TEXT PRIMARY KEY, info TEXT NOT NULL, videos TEXT NOT NULL,
+    fetched_at REAL NOT NULL, full_synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS whisper_models (
+    pid INTEGER NOT NULL, model TEXT NOT NULL, compute_type TEXT NOT NULL, status TEXT NOT NULL,
+    attempts INTEGER NOT NULL, load_sec REAL, rss_mb REAL, error TEXT, retry_at REAL, updated_at REAL NOT NULL,
+    PRIMARY KEY (pid, model, compute_type)
+);
+CREATE TABLE IF NOT EXISTS channel_aggregates (
+    channel_id TEXT PRIMARY KEY, aggregates TEXT NOT NULL
+);
+"""
+# 이미 만들어진 DB에 나중에 추가한 열. 이미 있으면 OperationalError가 나므로 무시한다
+_MIGRATIONS = [
+    "ALTER TABLE transcribe_jobs ADD COLUMN options TEXT",
+    "ALTER TABLE transcribe_jobs ADD COLUMN client TEXT",
+    "ALTER TABLE transcribe_jobs ADD COLUMN last_seen REAL",
+]
+_db_ready = False
 
-def extract_channel_id(url):
-    yt = get_youtube_client()
+@contextmanager
+def get_db():
+    """요청마다 짧게 여는 SQLite 연결. 첫 연결에서 스키마를 만든다."""
+    global _db_ready
+    if not _db_ready:
+        os.makedirs(os.path.dirname(CACHE_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB, timeout=30)
     try:
-        if "channel/" in url:
-            return url.split("channel/")[1].split("/")[0]
-        if "user/" in url:
-            user = url.split("user/")[1].split("/")[0]
-            return yt.channels().list(part="id", forUsername=user).execute()["items"][0]["id"]
-        if "/@" in url:
-            handle = url.split("/@")[1].split("/")[0]
-            return yt.channels().list(part="id", forHandle=handle).execute()["items"][0]["id"]
-    except Exception:
-        logger.exception(f"채널 ID 추출 실패: {url}")
-    return None
+        if not _db_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            for stmt in _MIGRATIONS:
+                try:
+                    conn.execute(stmt)
+                except sqlite3.OperationalError:
+                    pass
+            _db_ready = True
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+# --- 대기 ---
+def cooperative_sleep(sec):
+    """gevent 워커에서는 gevent.sleep으로 허브에 양보한다 (monkey patch 상태면 time.sleep과 같다)"""
+    gevent = sys.modules.get("gevent")
+    (gevent.sleep if gevent else time.sleep)(sec)
+
+# --- 파일 락 (프로세스 간) ---
+def acquire_file_lock(path, timeout=0):
+    """path에 배타적 flock을 잡고 열린 파일을 돌려준다. timeout초 안에 못 잡으면 None.
+    flock은 열린 파일 단위이므로 같은 프로세스의 다른 스레드끼리도 배타적이다.
+    gevent 워커를 막지 않도록 블로킹 대기 대신 짧게 재시도한다. fcntl이 없으면(Windows) 락 없이 진행한다."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "a")
+    if not fcntl: return f
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return f
+        except OSError:
+            if time.monotonic() >= deadline:
+                f.close()
+                return None
+            cooperative_sleep(0.2)
+
+def release_file_lock(f):
+    if f: f.close()  # 닫으면 flock도 풀린다
+
+# --- 재시도 정책 ---
+class CircuitOpen(Exception):
+    """연속 실패로 차단기가 열려 있어 요청을 보내지 않고 바로 실패함"""
+
+class RetryPolicy:
+    """지수 백오프 + full jitter 재시도, 시간 창당 재시도 예산, 서킷 브레이커를 묶은 공용 정책.
+    retryable(e)가 참인 실패만 재시도한다. 재시도 예산을 다 쓰면 더 기다리지 않고 바로 실패를 돌려주고,
+    그런 실패가 threshold번 이어지면 cooldown초 동안 요청 자체를 보내지 않는다 (YouTube가 막고 있을 때)."""
+    def __init__(self, name, retryable, attempts=RETRY_ATTEMPTS, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY,
+                 budget=RETRY_BUDGET_PER_MIN, window=60, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.name, self.retryable = name, retryable
+        self.attempts, self.base, self.cap = attempts, base, cap
+        self.budget, self.window = budget, window
+        self.threshold, self.cooldown = threshold, cooldown
+        self._lock = threading.Lock()
+        self._retries = collections.deque()  # 최근 재시도 시각
+        self._failures, self._opened_at = 0, None
+
+    def _before_call(self):
+        with self._lock:
+            if self._opened_at is None: return
+            if time.monotonic() - self._opened_at < self.cooldown:
+                raise CircuitOpen(f"{self.name}: 연속 실패로 요청을 잠시 멈췄습니다")
+            # half-open: 이 요청 하나만 시험 삼아 보내고 나머지는 cooldown만큼 더 막는다
+            self._opened_at = time.monotonic()
+
+    def _on_success(self):
+        with self._lock:
+            self._failures, self._opened_at = 0, None
+
+    def _on_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold and self._opened_at is None:
+                self._opened_at = time.monotonic()
+                logger.warning(f"{self.name}: 연속 실패 {self._failures}회, {self.cooldown}초 동안 차단")
+
+    def _take_retry_token(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._retries and now - self._retries[0] > self.window:
+                self._retries.popleft()
+            if len(self._retries) >= self.budget: return False
+            self._retries.append(now)
+            return True
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def _should_retry(self, e, attempt):
+        if not self.retryable(e):
+            # 404, 비공개 영상 같은 오류는 업스트림이 응답하고 있다는 뜻이므로 차단기를 닫는다 (half-open 시험 포함)
+            self._on_success()
+            return None
+        self._on_failure()
+        if attempt == self.attempts - 1 or self._opened_at is not None or not self._take_retry_token():
+            return None  # 차단기가 열렸으면 (half-open 시험 실패 포함) 원래 오류를 그대로 돌려준다
+        delay = self.backoff(attempt)
+        logger.warning(f"{self.name}: {e!r}, {delay:.2f}초 후 재시도 ({attempt+1}/{self.attempts})")
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.attempts):
+            self._before_call()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._should_retry(e, attempt)
+                if delay is None: raise
+                cooperative_sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """asyncio용: fn은 코루틴 함수이고 대기는 asyncio.sleep으로 한다"""
+        import asyncio
+        for attempt in range(self.attempts):
+            self._before_call()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._should_retry(e, attempt)
+                if delay is None: raise
+                await asyncio.sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+def _pytube_retryable(e):
+    # urllib HTTPError, 또는 asgi.py에서 쓰는 httpx.HTTPStatusError
+    status = e.code if isinstance(e, HTTPError) else getattr(getattr(e, "response", None), "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
 
-def fetch_videos(channel_id, max_v=200):
-    yt = get_youtube_client()
+_RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+
+def _data_api_retryable(e):
+    status = google_http_status(e)
+    content = getattr(e, "content", b"") or b""
+    return status in (429, 500, 502, 503, 504) or (status == 403 and any(r in content for r in _RATE_LIMIT_REASONS))
+
+PYTUBE_RETRY = RetryPolicy("youtube", _pytube_retryable)
+DATA_API_RETRY = RetryPolicy("data-api", _data_api_retryable)
+
+# --- YouTube API 클라이언트 풀 ---
+# googleapiclient 리소스와 그 httplib2.Http는 스레드 안전하지 않으므로 스레드끼리 공유하지 않고 빌려 쓴다.
+_client_pool = queue.LifoQueue(maxsize=YOUTUBE_CLIENT_POOL_SIZE)
+_discovery_blob, _discovery_lock = None, threading.Lock()
+
+def youtube_discovery_doc():
+    """YouTube v3 discovery 문서를 네트워크 없이 로컬에서 읽는다. JSON 파싱은 프로세스당 한 번만 하고
+    pickle로 보관해 둔다. googleapiclient가 문서 dict를 제자리에서 고치므로 클라이언트마다 새 사본을 준다."""
+    from googleapiclient.discovery_cache import get_static_doc
+    global _discovery_blob
+    with _discovery_lock:
+        if _discovery_blob is None:
+            if YOUTUBE_DISCOVERY_DOC:
+                with open(YOUTUBE_DISCOVERY_DOC, encoding="utf-8") as f:
+                    doc = f.read()
+            else:
+                doc = get_static_doc("youtube", "v3")
+            _discovery_blob = pickle.dumps(json.loads(doc), protocol=pickle.HIGHEST_PROTOCOL)
+    return pickle.loads(_discovery_blob)
+
+def build_youtube_client():
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
+    # API 키는 api_execute가 요청마다 골라 붙인다
+    return build_from_document(youtube_discovery_doc(), http=build_http())
+
+@contextmanager
+def youtube_client():
+    """풀에서 클라이언트를 하나 빌려준다. 유휴 클라이언트가 없으면 새로 만들고,
+    반납할 때 풀이 가득 차 있으면 버린다. 각 클라이언트는 자기 keep-alive 연결을 계속 재사용한다."""
     try:
-        ch = yt.channels().list(part="contentDetails", id=channel_id).execute()
-        uploads = ch["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
-        vids, token = [], None
-        while len(vids) < max_v:
-            r = yt.playlistItems().list(part="snippet", playlistId=uploads, maxResults=50, pageToken=token).execute()
-            vids += [i["snippet"]["resourceId"]["videoId"] for i in r.get("items", [])]
-            token = r.get("nextPageToken")
-            if not token: break
-        
+        yt = _client_pool.get_nowait()
+    except queue.Empty:
+        yt = build_youtube_client()
+    try:
+        yield yt
+    finally:
+        try:
+            _client_pool.put_nowait(yt)
+        except queue.Full:
+            pass
+
+# --- Data API 호출 ---
+def google_http_status(e):
+    """googleapiclient HttpError의 HTTP 상태 코드. 다른 예외면 None (모듈을 미리 import하지 않도록 덕 타이핑)"""
+    return getattr(getattr(e, "resp", None), "status", None)
+
+def google_error_reason(e):
+    """오류 응답 본문의 error.errors[0].reason (quotaExceeded, keyInvalid 등). 없으면 None"""
+    try:
+        return json.loads(getattr(e, "content", b"") or b"")["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+def describe_api_error(e):
+    """사용자/통계에 보여 줄 오류 요약 (상태 코드와 reason만).
+    str(HttpError)에는 key=가 붙은 요청 URI가 들어 있으므로 그대로 내보내지 않는다."""
+    status = google_http_status(e)
+    if status is None: return type(e).__name__
+    reason = google_error_reason(e)
+    return f"{status} {reason}" if reason else str(status)
+
+_api_pool = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="yt-api")
+_key_slots, _key_slots_lock = {}, threading.Lock()
+
+def key_slot(key):
+    """API 키별 동시 요청 수를 제한하는 세마포어"""
+    with _key_slots_lock:
+        if key not in _key_slots:
+            _key_slots[key] = threading.BoundedSemaphore(API_KEY_CONCURRENCY)
+        return _key_slots[key]
+
+# --- Data API 할당량 ---
+# 메서드별 할당량 비용 (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COSTS = {
+    "youtube.channels.list": 1,
+    "youtube.playlistItems.list": 1,
+    "youtube.videos.list": 1,
+    "youtube.search.list": 100,
+}
+
+try:
+    from zoneinfo import ZoneInfo
+    _QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+except Exception:  # tzdata가 없는 환경
+    _QUOTA_TZ = timezone(timedelta(hours=-8))
+
+class QuotaExhausted(Exception):
+    """남은 할당량으로는 요청을 보낼 수 없음"""
+
+def quota_day():
+    return datetime.now(_QUOTA_TZ).strftime("%Y-%m-%d")
+
+def quota_reset_at():
+    now = datetime.now(_QUOTA_TZ)
+    return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def key_id(key):
+    """로그/DB에 키 원문을 남기지 않기 위한 짧은 식별자"""
+    return hashlib.sha1(key.encode()).hexdigest()[:8]
+
+def record_quota(key, units):
+    with get_db() as db:
+        db.execute("INSERT INTO quota_usage VALUES (?,?,?,1) ON CONFLICT (key_id, day) "
+                   "DO UPDATE SET units=units+excluded.units, calls=calls+1", (key_id(key), quota_day(), units))
+
+def quota_used(key):
+    with get_db() as db:
+        row = db.execute("SELECT units FROM quota_usage WHERE key_id=? AND day=?", (key_id(key), quota_day())).fetchone()
+    return row[0] if row else 0
+
+def remaining_quota(key=None):
+    """key를 주면 그 키의, 아니면 쓸 수 있는 모든 키의 남은 할당량 합"""
+    if key: return max(QUOTA_DAILY_LIMIT - quota_used(key), 0)
+    return sum(remaining_quota(k) for k, _ in API_KEYS if not api_keys.disabled(k))
+
+def quota_low():
+    return remaining_quota() < QUOTA_LOW_WATERMARK
+
+def is_quota_error(e):
+    """일일 할당량 초과 응답(403 quotaExceeded/dailyLimitExceeded)이거나 로컬 예산 초과인지.
+    429/rateLimitExceeded는 일시적인 속도 제한이므로 DATA_API_RETRY가 백오프로 다시 시도한다."""
+    if isinstance(e, QuotaExhausted): return True
+    content = getattr(e, "content", b"") or b""
+    return google_http_status(e) == 403 and (b"quotaExceeded" in content or b"dailyLimitExceeded" in content)
+
+_KEY_ERROR_REASONS = (b"keyInvalid", b"keyExpired", b"API_KEY_INVALID", b"accessNotConfigured",
+                      b"ipRefererBlocked", b"API_KEY_SERVICE_BLOCKED")
+
+def is_key_error(e):
+    """키 자체의 문제(무효/만료/API 미사용 설정 등)로 거절된 403/400. 특정 리소스 접근 거부 403은 해당 없음"""
+    content = getattr(e, "content", b"") or b""
+    return google_http_status(e) in (400, 403) and any(r in content for r in _KEY_ERROR_REASONS)
+
+# --- API 키 순환 ---
+class ApiKeyPool:
+    """가중치 라운드 로빈(smooth weighted round-robin)으로 키를 고른다. 할당량 초과나 키 오류가 난 키는
+    다음 할당량 초기화 시각까지 빼 둔다. 키별 호출 수/오류 수/지연 시간은 이 프로세스 기준으로 센다."""
+    def __init__(self, keys):
+        self._lock = threading.Lock()
+        self.states = {key: {"weight": weight, "current": 0, "calls": 0, "errors": 0, "latency": 0.0,
+                             "last_error": None, "disabled_until": None} for key, weight in keys}
+
+    def disabled(self, key):
+        until = self.states[key]["disabled_until"]
+        return until is not None and datetime.now(timezone.utc) < until
+
+    def pick(self, cost, exclude=()):
+        """cost만큼 남은 키 중 하나. 없으면 None"""
+        while True:
+            with self._lock:
+                cands = [k for k, st in self.states.items() if k not in exclude and not self.disabled(k)]
+                if not cands: return None
+                total = sum(self.states[k]["weight"] for k in cands)
+                for k in cands:
+                    self.states[k]["current"] += self.states[k]["weight"]
+                key = max(cands, key=lambda k: self.states[k]["current"])
+                self.states[key]["current"] -= total
+            if remaining_quota(key) >= cost: return key
+            self.disable(key, "일일 할당량 소진")  # 다른 프로세스가 다 쓴 키
+
+    def disable(self, key, reason):
+        with self._lock:
+            self.states[key]["disabled_until"] = quota_reset_at()
+        logger.warning(f"API 키 {key_id(key)} 사용 중지 ({reason}), {quota_reset_at().isoformat()}까지")
+
+    def record(self, key, latency, error=None):
+        with self._lock:
+            st = self.states[key]
+            st["calls"] += 1
+            st["latency"] += latency
+            if error is not None:
+                st["errors"] += 1
+                st["last_error"] = describe_api_error(error)
+
+    def stats(self):
+        with self._lock:
+            snapshot = {k: dict(st) for k, st in self.states.items()}
         out = []
-        for i in range(0, len(vids), 50):
-            batch = vids[i:i+50]
-            r2 = yt.videos().list(part="snippet,statistics,contentDetails", id=",".join(batch)).execute()
-            for v in r2.get("items", []):
-                sn, st, cd = v["snippet"], v["statistics"], v.get("contentDetails",{})
-                out.append({
-                    "id": v["id"], "title": sn.get("title",""),
-                    "thumb": sn.get("thumbnails",{}).get("medium",{}).get("url",""),
-                    "url": f"https://youtu.be/{v['id']}",
-                    "published": parse_iso_date(sn.get("publishedAt","")),
-                    "views": int(st.get("viewCount",0)), "likes": int(st.get("likeCount",0)),
-                    "comments": int(st.get("commentCount",0)),
-                    "duration_sec": parse_duration(cd.get("duration",""))
-                })
+        for key, st in snapshot.items():
+            used = quota_used(key)
+            out.append({
+                "key_id": key_id(key), "weight": st["weight"], "used": used,
+                "remaining": max(QUOTA_DAILY_LIMIT - used, 0), "disabled": self.disabled(key),
+                "disabled_until": st["disabled_until"].isoformat() if st["disabled_until"] else None,
+                "calls": st["calls"], "errors": st["errors"], "last_error": st["last_error"],
+                "avg_latency_ms": round(st["latency"] / st["calls"] * 1000, 1) if st["calls"] else None,
+            })
         return out
+
+api_keys = ApiKeyPool(API_KEYS)
+
+def with_api_key(uri, key):
+    parts = urlsplit(uri)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "key"]
+    return urlunsplit(parts._replace(query=urlencode(query + [("key", key)])))
+
+def lookup_api_etag(etag_key):
+    """(etag, 저장된 응답 JSON) 또는 None"""
+    with get_db() as db:
+        return db.execute("SELECT etag, body FROM api_etags WHERE key=?", (etag_key,)).fetchone()
+
+def store_api_etag(etag_key, body):
+    if not body.get("etag"): return
+    now = time.time()
+    with get_db() as db:
+        db.execute("INSERT OR REPLACE INTO api_etags VALUES (?,?,?,?)", (etag_key, body["etag"], json.dumps(body), now))
+        db.execute("DELETE FROM api_etags WHERE updated_at < ?", (now - API_ETAG_TTL,))
+
+def touch_api_etag(etag_key):
+    """304로 재검증된 응답은 계속 쓰이고 있으므로 API_ETAG_TTL 정리에서 빠지도록 시각을 갱신한다"""
+    with get_db() as db:
+        db.execute("UPDATE api_etags SET updated_at=? WHERE key=?", (time.time(), etag_key))
+
+def on_api_error(key, e, cost, attempts):
+    """실패한 호출의 할당량/키 상태를 정리한다. 이 키를 빼고 다른 키로 다시 보내야 하면 True"""
+    if is_quota_error(e):
+        # 서버가 한도 초과라고 하면 이 키의 오늘 남은 양을 0으로 맞추고 다른 키로 넘어간다
+        record_quota(key, remaining_quota(key))
+        api_keys.disable(key, "할당량 초과 응답")
+        return True
+    if attempts: record_quota(key, cost * attempts)
+    if is_key_error(e):
+        api_keys.disable(key, "키 오류")
+        return True
+    return False
+
+def api_execute(req, etag_key=None):
+    """Data API 요청 실행. etag_key가 있으면 If-None-Match로 재검증하고, 304면 저장해 둔 응답을 돌려준다.
+    메서드별 비용만큼 할당량을 기록하고, 남은 할당량이 모자라면 보내지 않고 QuotaExhausted를 낸다.
+    키는 ApiKeyPool에서 고르며, 할당량 초과/키 오류가 나면 그 키를 빼고 다른 키로 다시 보낸다."""
+    cost = QUOTA_COSTS.get(getattr(req, "methodId", None), 1)
+    cached = lookup_api_etag(etag_key) if etag_key else None
+    if cached: req.headers["If-None-Match"] = cached[0]
+    tried = set()
+    while True:
+        key = api_keys.pick(cost, exclude=tried)
+        if key is None:
+            raise QuotaExhausted("남은 할당량이 있는 API 키가 없습니다")
+        tried.add(key)
+        req.uri = with_api_key(req.uri, key)
+        started, attempts = time.monotonic(), [0]
+
+        def attempt():
+            attempts[0] += 1
+            with key_slot(key):  # 백오프 대기 중에는 슬롯을 잡고 있지 않는다
+                return req.execute()
+        try:
+            body = DATA_API_RETRY.call(attempt)
+        except Exception as e:
+            latency = time.monotonic() - started
+            if cached and google_http_status(e) == 304:
+                api_keys.record(key, latency)
+                touch_api_etag(etag_key)
+                return json.loads(cached[1])  # 변경 없음: 할당량을 쓰지 않은 것으로 본다
+            api_keys.record(key, latency, e)
+            if on_api_error(key, e, cost, attempts[0]): continue
+            raise
+        api_keys.record(key, time.monotonic() - started)
+        record_quota(key, cost * attempts[0])  # 재시도한 요청도 할당량을 쓴다
+        break
+    if etag_key: store_api_etag(etag_key, body)
+    return body
+
+# --- 채널 URL → 채널 ID ---
+CHANNEL_ID_RE = re.compile(r'^UC[\w-]{22}$')
+# youtube.com/<이름> 형태의 옛 커스텀 URL로 보지 않을 경로 (YouTube 자체 페이지)
+_RESERVED_PATHS = {
+    "watch", "results", "feed", "playlist", "shorts", "live", "embed", "channel", "user", "c",
+    "about", "account", "ads", "attribution_link", "channel_switcher", "copyright", "courses", "creators",
+    "fashion", "gaming", "hashtag", "howyoutubeworks", "jobs", "kids", "learning", "logout", "movies", "music",
+    "new", "news", "originals", "paid_memberships", "podcasts", "post", "premium", "redirect", "reporthistory",
+    "signin", "source", "sports", "supported_browsers", "t", "trending", "tv", "upload", "yt",
+}
+# 옛 커스텀 URL 이름: 영문/숫자/한글 등 글자와 숫자만 (점, 하이픈, 파일 확장자가 붙은 경로는 채널이 아니다)
+LEGACY_CUSTOM_RE = re.compile(r'^[^\W_]{3,100}$')
+CANONICAL_CHANNEL_RE = re.compile(r'<link rel="canonical" href="https://www\.youtube\.com/channel/(UC[\w-]{22})"')
+
+def parse_channel_url(url):
+    """입력을 (종류, 값)으로 분류한다. 종류: channel, handle, user, custom, video. 알 수 없으면 None"""
+    url = url.strip()
+    if CHANNEL_ID_RE.match(url): return ("channel", url)
+    if url.startswith("@"): return ("handle", url[1:].split("/")[0].lower())
+    if "://" not in url: url = "https://" + url
+    u = urlsplit(url)
+    host = u.netloc.lower().split(":")[0]
+    for prefix in ("www.", "m.", "music."):
+        host = host.removeprefix(prefix)
+    parts = [unquote(p) for p in u.path.split("/") if p]
+    if host == "youtu.be":
+        return ("video", parts[0]) if parts else None
+    if host != "youtube.com" or not parts: return None
+    head = parts[0]
+    if head.startswith("@"): return ("handle", head[1:].lower())
+    if head == "watch":
+        v = parse_qs(u.query).get("v")
+        return ("video", v[0]) if v else None
+    if len(parts) > 1:
+        if head == "channel": return ("channel", parts[1]) if CHANNEL_ID_RE.fullmatch(parts[1]) else None
+        if head == "user": return ("user", parts[1])
+        if head == "c": return ("custom", parts[1])
+        if head in ("shorts", "live", "embed"): return ("video", parts[1])
+    if len(parts) == 1 and head.lower() not in _RESERVED_PATHS and LEGACY_CUSTOM_RE.match(head):
+        return ("custom", head)
+    return None
+
+def lookup_channel_index(kind, value):
+    with get_db() as db:
+        row = db.execute("SELECT channel_id, resolved_at FROM channel_index WHERE kind=? AND value=?",
+                         (kind, value)).fetchone()
+    return row[0] if row and time.time() - row[1] < CHANNEL_INDEX_TTL else None
+
+def store_channel_index(kind, value, cid):
+    with get_db() as db:
+        db.execute("INSERT OR REPLACE INTO channel_index VALUES (?,?,?,?)", (kind, value, cid, time.time()))
+
+def _first_id(body):
+    items = body.get("items") or []
+    return items[0]["id"] if items else None
+
+def scrape_channel_id(url):
+    """API로 찾을 수 없는 옛 커스텀 URL은 채널 페이지의 canonical 링크에서 채널 ID를 읽는다 (API 할당량 사용 안 함)"""
+    import urllib.request
+    req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0", "Accept-Language": "ko"})
+    with urllib.request.urlopen(req, timeout=10) as r:
+        html = r.read(512 * 1024).decode("utf-8", "ignore")
+    m = CANONICAL_CHANNEL_RE.search(html)
+    return m.group(1) if m else None
+
+def resolve_channel_id(kind, value):
+    with youtube_client() as yt:
+        if kind == "handle":
+            return _first_id(api_execute(yt.channels().list(part="id", forHandle=value)))
+        if kind == "user":
+            return _first_id(api_execute(yt.channels().list(part="id", forUsername=value)))
+        if kind == "video":
+            items = api_execute(yt.videos().list(part="snippet", id=value)).get("items") or []
+            return items[0]["snippet"]["channelId"] if items else None
+        if kind == "custom":
+            # 대부분의 커스텀 URL은 같은 이름의 핸들이나 옛 사용자명으로 옮겨져 있다
+            cid = (_first_id(api_execute(yt.channels().list(part="id", forHandle=value)))
+                   or _first_id(api_execute(yt.channels().list(part="id", forUsername=value))))
+            return cid or scrape_channel_id(f"https://www.youtube.com/c/{quote(value)}")
+    return None
+
+def extract_channel_id(url):
+    """채널/핸들/사용자명/커스텀 URL, 영상 링크, 채널 ID를 채널 ID로 바꾼다.
+    성공한 조회는 channel_index에 오래 보관해 같은 핸들에 API 호출을 다시 쓰지 않는다."""
+    parsed = parse_channel_url(url)
+    if not parsed: return None
+    kind, value = parsed
+    if kind == "channel": return value
+    cid = lookup_channel_index(kind, value)
+    if cid: return cid
+    try:
+        cid = resolve_channel_id(kind, value)
+    except Exception as e:
+        if is_quota_error(e): raise
+        logger.exception(f"채널 ID 추출 실패: {url}")
+        return None
+    if cid: store_channel_index(kind, value, cid)
+    return cid
+
+def iter_upload_ids(uploads, max_v=MAX_VIDEOS, known=None):
+    """업로드 재생목록의 영상 ID를 최신순으로 페이지 단위 yield. known에 있는 ID를 만나면 거기서 멈춘다."""
+    token, seen = None, 0
+    while seen < max_v:
+        with youtube_client() as yt:
+            r = api_execute(yt.playlistItems().list(part="snippet", playlistId=uploads, maxResults=50, pageToken=token),
+                            etag_key=f"playlistItems:{uploads}:{token or ''}")
+        ids = [i["snippet"]["resourceId"]["videoId"] for i in r.get("items", [])][:max_v - seen]
+        if known:
+            hit = next((n for n, vid in enumerate(ids) if vid in known), None)
+            if hit is not None:
+                if hit: yield ids[:hit]
+                return
+        seen += len(ids)
+        if ids: yield ids
+        token = r.get("nextPageToken")
+        if not token: return
+
+def parse_video(v):
+    sn, st, cd = v["snippet"], v.get("statistics", {}), v.get("contentDetails", {})
+    return {
+        "id": v["id"], "title": sn.get("title",""),
+        "thumb": sn.get("thumbnails",{}).get("medium",{}).get("url",""),
+        "url": f"https://youtu.be/{v['id']}",
+        "published": parse_iso_date(sn.get("publishedAt","")),
+        "views": int(st.get("viewCount",0)), "likes": int(st.get("likeCount",0)),
+        "comments": int(st.get("commentCount",0)),
+        "duration_sec": parse_duration(cd.get("duration",""))
+    }
+
+def fetch_video_batch(ids):
+    """videos.list 1회(최대 50개)"""
+    batch = ",".join(ids)
+    with youtube_client() as yt:
+        r = api_execute(yt.videos().list(part="snippet,statistics,contentDetails", id=batch),
+                        etag_key=f"videos:{hashlib.sha1(batch.encode()).hexdigest()}")
+    found = {v["id"]: parse_video(v) for v in r.get("items", [])}
+    return [found[vid] for vid in ids if vid in found]
+
+def fetch_video_details(ids):
+    """videos.list 배치를 스레드 풀에서 동시에 호출한다. 결과는 ids 순서를 따르고 삭제/비공개 영상은 빠진다."""
+    batches = [ids[i:i+50] for i in range(0, len(ids), 50)]
+    return [v for vs in _api_pool.map(fetch_video_batch, batches) for v in vs]
+
+def iter_videos(uploads, max_v=MAX_VIDEOS):
+    """영상 정보를 재생목록 페이지 단위로 yield한다. N페이지의 videos.list는 N+1페이지 playlistItems를 받는 동안 풀에서 돈다.
+    호출자가 필요한 만큼만 받고 멈추면 남은 페이지는 요청하지 않는다."""
+    pending = None
+    for page in iter_upload_ids(uploads, max_v):
+        future = _api_pool.submit(fetch_video_batch, page)
+        if pending: yield pending.result()
+        pending = future
+    if pending: yield pending.result()
+
+def fetch_videos(uploads, max_v=MAX_VIDEOS):
+    """업로드 재생목록을 최신순으로 훑어 영상 상세 정보 목록을 만든다. API 오류는 호출자에게 전달."""
+    return [v for page in iter_videos(uploads, max_v) for v in page]
+
+def sync_videos(uploads, cached, max_v=MAX_VIDEOS):
+    """증분 동기화. 캐시된 목록(최신순)에 없는 새 영상만 페이징하고, 새 영상과 최근 영상 통계를 한 번에 받는다.
+    매일 확인하는 채널이면 playlistItems 1회 + videos.list 1회로 끝난다.
+    max_v는 새로 받을 영상 수 한도다. 이미 받아 둔 영상은 MAX_VIDEOS까지 그대로 둔다."""
+    new_ids = [vid for page in iter_upload_ids(uploads, max_v, known={v["id"] for v in cached}) for vid in page]
+    recent = [v["id"] for v in cached[:max(SYNC_REFRESH_RECENT - len(new_ids), 0)]]
+    fresh = fetch_video_details(new_ids + recent)
+    checked = set(new_ids) | set(recent)
+    return (fresh + [v for v in cached if v["id"] not in checked])[:MAX_VIDEOS]
+
+# --- 채널 스냅샷 캐시 ---
+SORT_KEYS = ("published", "views", "likes", "comments", "duration_sec")  # 미리 정렬해 두는 sortBy 값
+
+def channel_aggregates(videos):
+    """/analyze의 채널 분석값과 정렬 순서. 스냅샷을 저장할 때 한 번만 계산하고, 페이지 뷰는 잘라 쓰기만 한다.
+    영상은 videos 안의 인덱스로 가리킨다."""
+    if not videos:
+        return {"summary": {}, "top_5": [], "orders": {k: [] for k in SORT_KEYS}}
+    td = tv = tl = tc = 0
+    first = last = videos[0]["published"]
+    for v in videos:
+        td += v.get("duration_sec", 0); tv += v.get("views", 0)
+        tl += v.get("likes", 0); tc += v.get("comments", 0)
+        first, last = min(first, v["published"]), max(last, v["published"])
+    weeks = max((last - first).days / 7, 1)
+    idx = range(len(videos))
+    return {
+        "summary": {
+            "uploads_per_week": round(len(videos)/weeks, 1),
+            "avg_duration": format_seconds(td/len(videos)),
+            "likes_per_1000_views": round(tl/tv*1000, 1) if tv else 0,
+            "comments_per_1000_views": round(tc/tv*1000, 1) if tv else 0,
+        },
+        "top_5": heapq.nlargest(5, idx, key=lambda i: videos[i]["views"]),
+        "orders": {k: sorted(idx, key=lambda i: videos[i].get(k, 0), reverse=True) for k in SORT_KEYS},
+    }
+
+def load_channel_snapshot(cid):
+    with get_db() as db:
+        row = db.execute("SELECT s.info, s.videos, s.fetched_at, s.full_synced_at, a.aggregates FROM channel_snapshots s "
+                         "LEFT JOIN channel_aggregates a USING (channel_id) WHERE s.channel_id=?", (cid,)).fetchone()
+    if not row: return None
+    videos = json.loads(row[1])
+    for v in videos:
+        v["published"] = datetime.fromisoformat(v["published"])
+    if row[4]:
+        aggregates = json.loads(row[4])
+    else:
+        # 집계 테이블이 생기기 전에 저장된 스냅샷
+        aggregates = channel_aggregates(videos)
+        with get_db() as db:
+            db.execute("INSERT OR REPLACE INTO channel_aggregates VALUES (?,?)", (cid, json.dumps(aggregates)))
+    return {"info": json.loads(row[0]), "videos": videos, "aggregates": aggregates,
+            "fetched_at": row[2], "full_synced_at": row[3]}
+
+def save_channel_snapshot(cid, info, videos, full_synced_at):
+    rows = [dict(v, published=v["published"].isoformat()) for v in videos]
+    aggregates = channel_aggregates(videos)
+    now = time.time()
+    with get_db() as db:
+        db.execute("INSERT OR REPLACE INTO channel_snapshots VALUES (?,?,?,?,?)",
+                   (cid, json.dumps(info), json.dumps(rows), now, full_synced_at))
+        db.execute("INSERT OR REPLACE INTO channel_aggregates VALUES (?,?)", (cid, json.dumps(aggregates)))
+    return {"info": info, "videos": videos, "aggregates": aggregates, "fetched_at": now, "full_synced_at": full_synced_at}
+
+def unsaved_snapshot(info, snap):
+    """영상 목록 갱신에 실패했을 때 보여 줄 스냅샷. 저장하지 않아 다음 요청에서 다시 시도한다."""
+    if snap:
+        return dict(snap, info=info, fetched_at=time.time())
+    return {"info": info, "videos": [], "aggregates": channel_aggregates([]), "fetched_at": time.time()}
+
+class SingleFlight:
+    """같은 키의 동시 호출을 하나로 합친다. 먼저 온 호출만 실행하고 나머지는 그 결과(또는 예외)를 함께 받는다."""
+    def __init__(self):
+        self._lock, self._calls = threading.Lock(), {}
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+_channel_flight = SingleFlight()
+
+def is_fresh(snap):
+    return snap and time.time() - snap["fetched_at"] < CHANNEL_CACHE_TTL
+
+def get_channel_snapshot(cid):
+    """채널 정보 + 영상 목록. TTL 안이면 API 호출 없이 캐시를 쓰고, 지났으면 ETag로 재검증해 갱신한다.
+    같은 채널을 동시에 분석하면 갱신은 한 번만 하고 모든 요청이 같은 결과를 받는다 (결과는 읽기 전용으로 쓸 것)."""
+    snap = load_channel_snapshot(cid)
+    if is_fresh(snap):
+        return snap
+    if snap and quota_low():
+        logger.warning(f"할당량 부족으로 오래된 캐시 사용 ({cid}, 남은 할당량 {remaining_quota()})")
+        return snap
+    return _channel_flight.do(cid, refresh_channel_snapshot, cid)
+
+def channel_lock_path(cid):
+    """채널 갱신용 파일 락 경로. 파일 이름에 들어가므로 형식이 맞는 채널 ID만 받는다"""
+    if not CHANNEL_ID_RE.fullmatch(cid):
+        raise ValueError(f"잘못된 채널 ID: {cid!r}")
+    return os.path.join(DATA_DIR, "locks", f"channel_{cid}.lock")
+
+def refresh_channel_snapshot(cid):
+    # 프로세스 내 중복은 SingleFlight가 막고, 다른 워커 프로세스와는 파일 락으로 한 번만 갱신한다
+    lock = acquire_file_lock(channel_lock_path(cid), CHANNEL_REFRESH_WAIT)
+    try:
+        snap = load_channel_snapshot(cid)
+        if is_fresh(snap):
+            return snap  # 기다리는 동안 다른 워커가 갱신했다
+        return fetch_channel_snapshot(cid, snap)
+    finally:
+        release_file_lock(lock)
+
+def fetch_channel_snapshot(cid, snap):
+    with youtube_client() as yt:
+        info = api_execute(yt.channels().list(part="snippet,statistics,contentDetails", id=cid),
+                           etag_key=f"channels:{cid}")["items"][0]
+    uploads = info["contentDetails"]["relatedPlaylists"]["uploads"]
+    degraded = quota_low()
+    max_v = QUOTA_DEGRADED_MAX_VIDEOS if degraded else MAX_VIDEOS
+    try:
+        if INCREMENTAL_SYNC and snap and snap["videos"] and (
+                degraded or time.time() - snap["full_synced_at"] < FULL_SYNC_TTL):
+            videos, full_synced_at = sync_videos(uploads, snap["videos"], max_v), snap["full_synced_at"]
+        else:
+            videos, full_synced_at = fetch_videos(uploads, max_v), time.time()
     except Exception:
         logger.exception("동영상 목록 로딩 중 오류")
-        return []
+        return unsaved_snapshot(info, snap)
+    # 할당량이 모자라 잘라 받은 목록은 전체 동기화로 치지 않는다. 할당량이 돌아온 뒤 첫 갱신에서 전체를 다시 받는다
+    return save_channel_snapshot(cid, info, videos, 0 if degraded else full_synced_at)
 
 # --- 라우트 정의 ---
 @app.route('/')
 def home():
     return render_template('index.html')
 
+# /analyze의 요청 해석, 오류 메시지, 렌더링은 asgi.py의 비동기 라우트와 함께 쓴다
+def analyze_params(args):
+    url = args.get('url','').strip()
+    sort_by = args.get('sortBy', 'published')
+    try: page = max(int(args.get('page',1)),1)
+    except: page = 1
+    return url, sort_by, page
+
+def analyze_error(e):
+    """채널 조회 중 난 예외를 사용자에게 보여 줄 문구로 바꾼다 (except 블록 안에서 부를 것)"""
+    status = google_http_status(e)
+    if is_quota_error(e) or status == 429 or isinstance(e, CircuitOpen):
+        return "API 사용량을 초과했습니다. 잠시 후 다시 시도해주세요."
+    if status:
+        return f"채널 정보 로딩 실패: {describe_api_error(e)}"
+    logger.exception('채널 정보 실패')
+    return '채널 정보 로딩 중 오류'
+
 @app.route('/analyze')
 def analyze():
-    url = request.args.get('url','').strip()
-    sort_by = request.args.get('sortBy', 'published')
-    try: page = max(int(request.args.get('page',1)),1)
-    except: page = 1
-    
+    url, sort_by, page = analyze_params(request.args)
     if not url: return render_template('index.html', error="URL을 입력해주세요.")
-    cid = extract_channel_id(url)
-    if not cid: return render_template('index.html', error="유효하지 않은 채널 URL입니다.")
-
     try:
-        info = get_youtube_client().channels().list(part='snippet,statistics',id=cid).execute()['items'][0]
-    except GoogleHttpError as e:
-        if e.resp.status == 429:
-            return render_template('index.html', error="API 사용량을 초과했습니다. 잠시 후 다시 시도해주세요.")
-        return render_template('index.html', error=f"채널 정보 로딩 실패: {e}")
-    except Exception:
-        logger.exception('채널 정보 실패')
-        return render_template('index.html', error='채널 정보 로딩 중 오류')
+        cid = extract_channel_id(url)
+        if not cid: return render_template('index.html', error="유효하지 않은 채널 URL입니다.")
+        snap = get_channel_snapshot(cid)
+    except Exception as e:
+        return render_template('index.html', error=analyze_error(e))
+    return render_analysis(snap, url, sort_by, page)
 
+def render_analysis(snap, url, sort_by, page):
+    info = snap['info']
     stats = {
         'title':info['snippet']['title'], 'description':info['snippet']['description'],
         'subscribers':int(info['statistics'].get('subscriberCount',0)), 
@@ -160,97 +1021,702 @@ def analyze():
         'profile_image':info['snippet']['thumbnails']['high']['url']
     }
     
-    videos = fetch_videos(cid)
-    if videos:
-        videos.sort(key=lambda x: x.get(sort_by, 0), reverse=True)
+    # 정렬 순서와 분석값은 스냅샷에 미리 계산되어 있다. 스냅샷은 동시 요청끼리 공유하므로 고치지 않는다
+    videos, agg = snap['videos'], snap['aggregates']
+    order = agg['orders'].get(sort_by)
+    if order is None:
+        order = sorted(range(len(videos)), key=lambda i: videos[i].get(sort_by, 0), reverse=True)
 
     per = 16
     total_pages = math.ceil(len(videos) / per) or 1
     if page > total_pages: page = total_pages
-    page_videos = videos[(page-1)*per : page*per]
+    page_videos = [videos[i] for i in order[(page-1)*per : page*per]]
 
-    analysis={}
-    if videos:
-        td, tv, tl, tc = (sum(v.get(k, 0) for v in videos) for k in ["duration_sec", "views", "likes", "comments"])
-        
-        sorted_by_date = sorted(videos, key=lambda x: x['published'])
-        weeks = max((sorted_by_date[-1]["published"] - sorted_by_date[0]["published"]).days / 7, 1) if len(videos) > 1 else 1
-
-        analysis = {
-            "uploads_per_week": round(len(videos)/weeks, 1),
-            "avg_duration": format_seconds(td/len(videos)) if videos else 'N/A',
-            "likes_per_1000_views": round(tl/tv*1000, 1) if tv else 0,
-            "comments_per_1000_views": round(tc/tv*1000, 1) if tv else 0,
-            "top_5_videos": sorted(videos, key=lambda x: x["views"], reverse=True)[:5]
-        }
+    analysis = dict(agg['summary'], top_5_videos=[videos[i] for i in agg['top_5']]) if videos else {}
 
     return render_template('analyze.html', stats=stats, videos=page_videos,
                            analysis=analysis, original_url=url, sort_by=sort_by,
                            total_pages=total_pages, current_page=page, CPM_USD=CPM_USD)
 
+@app.route('/api/quota')
+def quota_status():
+    keys = api_keys.stats()
+    return jsonify({
+        'day': quota_day(), 'reset_at': quota_reset_at().isoformat(),
+        'limit_per_key': QUOTA_DAILY_LIMIT, 'used': sum(k['used'] for k in keys),
+        'remaining': remaining_quota(), 'low': quota_low(), 'costs': QUOTA_COSTS, 'keys': keys,
+    })
+
 # --- 자막 & 다운로드 엔드포인트 ---
-def get_yt_with_retry(video_id, retries=3, delay=1):
-    for i in range(retries):
-        try:
-            # 봇 감지 회피 옵션을 항상 True로 설정
-            return YouTube(f"https://youtu.be/{video_id}", use_po_token=True)
-        except HTTPError as e:
-            if e.code == 429 and i < retries - 1:
-                logger.warning(f"429 에러, {delay}초 후 재시도... ({i+1}/{retries})")
-                time.sleep(delay)
-            else:
-                raise
-    return None
+def with_yt(video_id, fn):
+    """pytubefix YouTube 객체로 fn(yt)를 불러 결과를 돌려준다. pytubefix는 생성자에서는 요청을 보내지 않고
+    .streams, .captions, .title 등에 처음 접근할 때 받으므로, 그 접근을 모두 fn 안에서 해야 PYTUBE_RETRY가 적용된다.
+    재시도할 때는 반쯤 채워진 상태를 버리도록 객체를 새로 만든다."""
+    from pytubefix import YouTube
+    # 봇 감지 회피 옵션을 항상 True로 설정
+    return PYTUBE_RETRY.call(lambda: fn(YouTube(f"https://youtu.be/{video_id}", use_po_token=True)))
 
-@app.route('/get-caption/<video_id>')
-def get_caption(video_id):
+def lookup_caption(video_id, langs):
+    """캐시된 자막. 자막이 없는 영상은 lang=None인 음성(negative) 항목으로 저장되어 있다."""
+    with get_db() as db:
+        row = db.execute("SELECT lang, title, srt, fetched_at FROM captions WHERE video_id=? AND langs=?",
+                         (video_id, ",".join(langs))).fetchone()
+    if not row: return None
+    ttl = CAPTION_CACHE_TTL if row[0] else CAPTION_NEGATIVE_TTL
+    if time.time() - row[3] > ttl: return None
+    return {'lang': row[0], 'title': row[1], 'srt': row[2]}
+
+def store_caption(video_id, langs, lang=None, title=None, srt=None):
+    with get_db() as db:
+        db.execute("INSERT OR REPLACE INTO captions VALUES (?,?,?,?,?,?)",
+                   (video_id, ",".join(langs), lang, title, srt, time.time()))
+
+def load_caption(video_id):
+    """(응답 dict, 상태 코드). 캐시에 없으면 pytubefix로 받아 캐시에 넣는다."""
+    cached = lookup_caption(video_id, CAPTION_LANGS)
+    if cached:
+        if not cached['lang']: return {'error':'자막이 없습니다.'}, 404
+        return {'title': cached['title'], 'srt_content': cached['srt']}, 200
+    def fetch(yt):
+        lang = next((c for c in CAPTION_LANGS if yt.captions.get_by_language_code(c)), None)
+        if not lang: return None, None, None
+        return lang, yt.title, yt.captions.get_by_language_code(lang).generate_srt_captions()
     try:
-        yt = get_yt_with_retry(video_id)
-        if not yt: return jsonify({'error':'영상 정보를 가져올 수 없습니다.'}), 500
-        
-        cap = yt.captions.get_by_language_code('ko') or yt.captions.get_by_language_code('en') or yt.captions.get_by_language_code('a.en')
-        if not cap: return jsonify({'error':'자막이 없습니다.'}), 404
-        return jsonify({'title': yt.title, 'srt_content': cap.generate_srt_captions()})
+        lang, title, srt = with_yt(video_id, fetch)
+        if not lang:
+            store_caption(video_id, CAPTION_LANGS)
+            return {'error':'자막이 없습니다.'}, 404
+        store_caption(video_id, CAPTION_LANGS, lang, title, srt)
+        return {'title': title, 'srt_content': srt}, 200
     except Exception:
         logger.exception(f"자막 로딩 오류(video_id={video_id})")
-        return jsonify({'error':'자막 로딩 실패'}), 500
+        return {'error':'자막 로딩 실패'}, 500
 
-@app.route('/get-caption-ai/<video_id>')
-def get_caption_ai(video_id):
-    model = get_whisper_model()
-    if model is False: return jsonify({'error':'AI 자막 기능이 현재 비활성화 상태입니다.'}), 503
+@app.route('/get-caption/<video_id>')
+def get_caption(video_id):
+    payload, status = load_caption(video_id)
+    return jsonify(payload), status
+
+# --- AI 자막 결과 캐시 ---
+_RUNTIME_OPTIONS = ("cpu_threads", "num_workers")  # 속도에만 영향을 주고 결과는 같은 옵션
+
+def output_options(options):
+    out = {k: v for k, v in options.items() if k not in _RUNTIME_OPTIONS}
+    if not out.get("vad_filter"):
+        # VAD를 끈 결과는 VAD 도입 전 캐시 항목과 같다
+        out.pop("vad_filter", None); out.pop("vad_parameters", None)
+    if not out.get("batch_size"):
+        out.pop("batch_size", None)
+    return out
+
+def transcript_key(video_id, options):
+    """영상 ID + 결과에 영향을 주는 전사 옵션(모델, compute type, 언어, beam size, VAD) + 캐시 버전으로 만든 키"""
+    raw = json.dumps([video_id, TRANSCRIPT_CACHE_VERSION, output_options(options)], sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def lookup_transcript(video_id, options):
+    key = transcript_key(video_id, options)
+    with get_db() as db:
+        row = db.execute("SELECT title, srt FROM transcripts WHERE key=?", (key,)).fetchone()
+        if row:
+            db.execute("UPDATE transcripts SET last_access=? WHERE key=?", (time.time(), key))
+    return {'status': 'done', 'title': row[0], 'srt_content': row[1], 'cached': True} if row else None
+
+def store_transcript(video_id, options, title, srt):
+    now, size = time.time(), len(srt.encode())
+    with get_db() as db:
+        db.execute("INSERT OR REPLACE INTO transcripts VALUES (?,?,?,?,?,?,?,?,?)",
+                   (transcript_key(video_id, options), video_id, json.dumps(output_options(options), sort_keys=True),
+                    TRANSCRIPT_CACHE_VERSION, title, srt, size, now, now))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= TRANSCRIPT_CACHE_MAX_BYTES: return
+        # 상한을 넘으면 가장 오래 안 쓴 것부터 지운다
+        for key, sz in db.execute("SELECT key, size FROM transcripts ORDER BY last_access").fetchall():
+            if total <= TRANSCRIPT_CACHE_MAX_BYTES: break
+            db.execute("DELETE FROM transcripts WHERE key=?", (key,))
+            total -= sz
+
+def invalidate_transcripts(video_id=None):
+    """현재 캐시 버전이 아닌 항목을 지운다. video_id를 주면 그 영상의 항목은 버전과 관계없이 모두 지운다.
+    지운 항목 수를 돌려준다."""
+    with get_db() as db:
+        n = db.execute("DELETE FROM transcripts WHERE version != ?", (TRANSCRIPT_CACHE_VERSION,)).rowcount
+        if video_id:
+            n += db.execute("DELETE FROM transcripts WHERE video_id=?", (video_id,)).rowcount
+    return n
+
+@app.cli.command("invalidate-transcripts")
+@click.argument("video_ids", nargs=-1)
+def invalidate_transcripts_command(video_ids):
+    """저장된 AI 자막 삭제: flask --app app invalidate-transcripts [영상ID ...]
+    영상 ID를 주면 그 영상들의 자막을 모두, 주지 않으면 이전 캐시 버전의 자막만 지운다."""
+    n = sum(invalidate_transcripts(v) for v in video_ids or [None])
+    click.echo(f"AI 자막 {n}개 삭제")
+
+# --- AI 자막 작업 큐 ---
+# 작업은 SQLite에 쌓이므로 어느 웹 워커로 제출/조회해도 된다. 호스트마다 파일 락을 잡은 웹 워커 하나만
+# 디스패처를 돌리며, 디스패처가 오디오를 받아 프로세스 풀(TRANSCRIBE_WORKERS개)에 전사를 맡긴다.
+# 모델 메모리는 웹 워커 수가 아니라 풀 프로세스 수만큼만 든다.
+class JobError(Exception):
+    def __init__(self, message, code=500):
+        super().__init__(message)
+        self.message, self.code = message, code
+
+_dispatcher = {"lock_file": None, "procs": None, "threads": None}
+_dispatcher_start_lock = threading.Lock()
+_dispatch_wakeup = threading.Event()
+# 프로세스가 종료 중(gunicorn 재시작, max_requests 등)이면 더 이상 작업을 가져오지 않고, 풀에 맡기지 못한 작업은
+# 대기열로 돌려 다음 디스패처가 처리하게 한다. concurrent.futures는 종료 시 threading의 종료 훅에서 풀을 닫으므로
+# (atexit 훅보다 먼저 돈다) 같은 훅에 나중에 등록해 그보다 먼저 표시한다 (훅은 등록의 역순으로 돈다).
+_shutting_down = threading.Event()
+threading._register_atexit(_shutting_down.set)
+
+def model_args(options):
+    """transcriber.get_whisper_model 인자 (모델 인스턴스를 구분하는 옵션)"""
+    return (options["model"], options["compute_type"], options["cpu_threads"], options["num_workers"])
+
+def transcribe_options(tier=None):
+    """tier 이름 → 전사 옵션. 비어 있으면 기본 tier"""
+    tier = tier or TRANSCRIBE_DEFAULT_TIER
+    if tier not in TRANSCRIBE_TIERS:
+        raise JobError(f"알 수 없는 tier입니다: {tier} ({', '.join(TRANSCRIBE_TIERS)})", 400)
+    return TRANSCRIBE_TIERS[tier]
+
+def new_transcribe_pool():
+    # gunicorn 워커는 스레드를 가진 채 fork하면 위험하므로 spawn으로 깨끗한 프로세스를 띄운다
+    warm = [model_args(TRANSCRIBE_TIERS[t]) for t in WHISPER_PREWARM]
+    procs = ProcessPoolExecutor(max_workers=TRANSCRIBE_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=transcriber.init_worker,
+                                initargs=(WHISPER_CACHE_DIR, CACHE_DB, warm, WHISPER_LOAD_RETRY_BASE, WHISPER_LOAD_RETRY_MAX))
+    with get_db() as db:
+        db.execute("DELETE FROM whisper_models")  # 이전 풀 프로세스의 기록
+    if WHISPER_PREWARM:
+        # 풀은 작업이 들어와야 프로세스를 띄우므로 빈 작업으로 미리 띄워 모델 예열을 시작시킨다
+        for _ in range(TRANSCRIBE_WORKERS):
+            procs.submit(transcriber.ready)
+    return procs
+
+def ensure_transcribe_dispatcher():
+    """이 호스트에서 디스패처를 돌리는 프로세스가 없으면 이 프로세스가 맡는다."""
+    with _dispatcher_start_lock:
+        if _dispatcher["lock_file"]: return True
+        f = acquire_file_lock(os.path.join(DATA_DIR, "transcribe.lock"))
+        if not f: return False
+        invalidate_transcripts()
+        with get_db() as db:
+            # 락을 잡았다면 이전 디스패처는 죽은 것이므로 실행 중이던 작업을 다시 대기열로 돌린다
+            db.execute("DELETE FROM transcribe_cues WHERE job_id IN (SELECT id FROM transcribe_jobs WHERE status='running')")
+            db.execute("UPDATE transcribe_jobs SET status='queued' WHERE status='running'")
+        _dispatcher["procs"] = new_transcribe_pool()
+        _dispatcher["threads"] = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix="transcribe")
+        _dispatcher["lock_file"] = f
+        threading.Thread(target=_dispatch_loop, name="transcribe-dispatcher", daemon=True).start()
+        logger.info(f"AI 자막 디스패처 시작 (pid={os.getpid()}, workers={TRANSCRIBE_WORKERS})")
+        return True
+
+def _claim_next_job():
+    """다음에 실행할 작업. 클라이언트끼리 공평하게: 실행 중인 작업이 적은 클라이언트 먼저, 그다음 각 클라이언트의
+    n번째 대기 작업끼리(라운드 로빈), 마지막으로 먼저 들어온 순서. 한 사람이 여러 영상을 연달아 눌러도 다른 사람이 밀리지 않는다."""
+    with get_db() as db:
+        row = db.execute("""
+            SELECT id, video_id, options FROM transcribe_jobs j WHERE status='queued'
+            ORDER BY (SELECT COUNT(*) FROM transcribe_jobs r WHERE r.client IS j.client AND r.status='running'),
+                     (SELECT COUNT(*) FROM transcribe_jobs q WHERE q.client IS j.client AND q.status='queued'
+                        AND q.created_at < j.created_at),
+                     created_at
+            LIMIT 1""").fetchone()
+        if row:
+            db.execute("UPDATE transcribe_jobs SET status='running' WHERE id=?", (row[0],))
+        expired = time.time() - TRANSCRIBE_JOB_TTL
+        db.execute("DELETE FROM transcribe_cues WHERE job_id IN "
+                   "(SELECT id FROM transcribe_jobs WHERE finished_at < ?)", (expired,))
+        db.execute("DELETE FROM transcribe_jobs WHERE finished_at < ?", (expired,))
+    return row
+
+def _cancel_abandoned_jobs():
+    """지켜보는 클라이언트가 없어진 작업을 취소한다. 실행 중이던 작업은 풀 프로세스가 다음 flush 때 알아채고 멈춘다."""
+    now = time.time()
+    with get_db() as db:
+        cur = db.execute("UPDATE transcribe_jobs SET status='error', error=?, error_code=410, finished_at=? "
+                         "WHERE status IN ('queued','running') AND last_seen < ?",
+                         ('요청한 클라이언트의 연결이 끊겨 작업을 취소했습니다.', now, now - TRANSCRIBE_ABANDON_SEC))
+    if cur.rowcount:
+        logger.info(f"AI 자막 작업 {cur.rowcount}개 취소 (클라이언트 연결 끊김)")
+
+def touch_job(job_id):
+    """클라이언트가 아직 작업 결과를 기다리고 있음을 기록한다"""
+    with get_db() as db:
+        db.execute("UPDATE transcribe_jobs SET last_seen=? WHERE id=? AND status IN ('queued','running')",
+                   (time.time(), job_id))
+
+def _dispatch_loop():
+    slots = threading.Semaphore(TRANSCRIBE_WORKERS)
+    while not _shutting_down.is_set():
+        try:
+            _cancel_abandoned_jobs()
+        except Exception:
+            logger.exception("AI 자막 작업 취소 확인 실패")
+        if not slots.acquire(timeout=1):
+            continue  # 자리가 없어도 주기적으로 취소 확인은 한다
+        if _shutting_down.is_set(): break
+        try:
+            job = _claim_next_job()
+        except Exception:
+            logger.exception("AI 자막 작업 가져오기 실패")
+            job = None
+        if not job:
+            slots.release()
+            # 다른 워커가 넣은 작업은 DB를 다시 볼 때 집어 온다
+            _dispatch_wakeup.wait(1)
+            _dispatch_wakeup.clear()
+            continue
+        try:
+            future = _dispatcher["threads"].submit(run_transcribe_job, *job)
+        except RuntimeError:  # 종료가 시작돼 스레드 풀이 닫혔다
+            _requeue_job(job[0])
+            break
+        future.add_done_callback(lambda _: slots.release())
+    logger.info(f"AI 자막 디스패처 종료 (pid={os.getpid()})")
+
+def _update_job(job_id, **fields):
+    with get_db() as db:
+        db.execute(f"UPDATE transcribe_jobs SET {', '.join(f'{k}=?' for k in fields)} WHERE id=?",
+                   (*fields.values(), job_id))
+
+def _finish_job(job_id, **fields):
+    _update_job(job_id, finished_at=time.time(), **fields)
+
+def _requeue_job(job_id):
+    """실행하다 만 작업을 대기열로 돌린다 (처음부터 다시 전사하므로 기록한 자막 조각은 지운다)"""
+    with get_db() as db:
+        db.execute("DELETE FROM transcribe_cues WHERE job_id=?", (job_id,))
+        db.execute("UPDATE transcribe_jobs SET status='queued' WHERE id=? AND status='running'", (job_id,))
+    logger.info(f"AI 자막 작업을 대기열로 되돌림 (프로세스 종료 중, {job_id})")
 
+def transcribe_audio(procs, job_id, path, workdir, options, length):
+    """짧은 영상은 풀 프로세스 하나가 통째로 전사한다. 긴 영상은 무음 구간에서 나눈 조각들을 풀 전체에 나눠 맡기고,
+    앞 조각부터 끝나는 대로 시각을 보정해 이어 붙이면서 자막 조각을 기록한다 (SSE는 순서대로 받는다)."""
+    if load_job(job_id)['status'] != 'running':
+        raise transcriber.JobCancelled(job_id)  # 오디오를 받는 동안 취소됐다
+    if TRANSCRIBE_WORKERS < 2 or not TRANSCRIBE_CHUNK_SEC or length < TRANSCRIBE_CHUNK_MIN_SEC:
+        return procs.submit(transcriber.transcribe_file, path, job_id, **options).result()
+    chunks = procs.submit(transcriber.split_audio, path, workdir, TRANSCRIBE_CHUNK_SEC,
+                          options["vad_parameters"]).result()
+    futures = [procs.submit(transcriber.transcribe_chunk, p, offset, job_id, **options) for p, offset in chunks]
+    cues = []
     try:
-        yt = get_yt_with_retry(video_id)
-        if not yt: return jsonify({'error':'영상 정보를 가져올 수 없습니다.'}), 500
+        for f in futures:
+            start = len(cues)
+            for seg in f.result():
+                cues.append(transcriber.srt_cue(len(cues), *seg))
+            with get_db() as db:
+                db.executemany("INSERT OR REPLACE INTO transcribe_cues VALUES (?,?,?)",
+                               [(job_id, i, cues[i]) for i in range(start, len(cues))])
+    finally:
+        for f in futures: f.cancel()  # 실패했으면 아직 시작하지 않은 조각은 버린다
+    return "\n\n".join(cues)
 
-        stream = yt.streams.filter(only_audio=True, file_extension="mp4").first()
-        if not stream: return jsonify({'error':'오디오 스트림 없음'}),404
-        
+def run_transcribe_job(job_id, video_id, options=None):
+    """오디오 다운로드는 이 스레드에서, 전사는 프로세스 풀에서 한다."""
+    options = json.loads(options) if options else TRANSCRIBE_OPTIONS  # options 열이 없던 때 들어온 작업
+    procs = _dispatcher["procs"]
+    try:
+        stream, title, length = with_yt(video_id, lambda yt: (
+            yt.streams.filter(only_audio=True, file_extension="mp4").first(), yt.title, getattr(yt, "length", None)))
+        if not stream: raise JobError('오디오 스트림 없음', 404)
+        title = f"[AI] {title}"
+        _update_job(job_id, title=title)
         with tempfile.TemporaryDirectory() as td:
             path = stream.download(output_path=td)
-            segs, _ = model.transcribe(path, beam_size=5, language="ko")
-            lines = [f"{i+1}\n{int(s.start//3600):02}:{int(s.start%3600//60):02}:{int(s.start%60):02},{int(s.start*1000%1000):03} --> {int(s.end//3600):02}:{int(s.end%3600//60):02}:{int(s.end%60):02},{int(s.end*1000%1000):03}\n{s.text.strip()}" for i, s in enumerate(segs)]
-        return jsonify({'title':f"[AI] {yt.title}", 'srt_content':"\n\n".join(lines)})
-    except Exception:
+            srt = transcribe_audio(procs, job_id, path, td, options, length or 0)
+        store_transcript(video_id, options, title, srt)
+        _finish_job(job_id, status='done', srt=srt)
+    except transcriber.JobCancelled:
+        logger.info(f"AI 자막 작업 취소됨({video_id}, {job_id})")
+    except transcriber.ModelUnavailable:
+        _finish_job(job_id, status='error', error='AI 자막 모델을 준비하지 못했습니다. 잠시 후 다시 시도해주세요.', error_code=503)
+    except JobError as e:
+        _finish_job(job_id, status='error', error=e.message, error_code=e.code)
+    except BrokenProcessPool:
+        if _shutting_down.is_set():
+            return _requeue_job(job_id)  # 종료 신호로 풀 프로세스도 같이 끝났다
+        # 풀 프로세스가 죽었으면(OOM 등) 풀을 새로 만들어 다음 작업은 정상 처리되게 한다.
+        # 같은 풀에서 돌던 작업들이 한꺼번에 여기로 오므로 깨진 풀을 아직 쓰고 있을 때 한 번만 바꾼다
+        logger.exception(f"AI 자막 풀 프로세스 비정상 종료({video_id})")
+        with _dispatcher_start_lock:
+            if _dispatcher["procs"] is procs:
+                _dispatcher["procs"] = new_transcribe_pool()
+                procs.shutdown(wait=False)
+        _finish_job(job_id, status='error', error='AI 자막 실패', error_code=500)
+    except Exception as e:
+        if _shutting_down.is_set() and isinstance(e, RuntimeError):
+            return _requeue_job(job_id)  # 종료가 시작돼 풀이 새 작업을 받지 않는다
         logger.exception(f"AI 자막 오류({video_id})")
-        return jsonify({'error':'AI 자막 실패'}), 500
+        _finish_job(job_id, status='error', error='AI 자막 실패', error_code=500)
 
-@app.route('/download-video/<video_id>')
-def download_video(video_id):
+def client_key(forwarded_for, remote_addr):
+    """공평한 작업 순서와 클라이언트별 대기 상한을 위한 요청자 구분값. 주소 자체는 저장하지 않는다.
+    X-Forwarded-For의 앞부분은 클라이언트가 마음대로 넣을 수 있으므로, 앞단 프록시(Render)가 맨 뒤에 붙인 주소를 쓴다."""
+    addr = (forwarded_for or remote_addr or '').split(',')[-1].strip()
+    return hashlib.sha1(addr.encode()).hexdigest()[:12]
+
+def client_id():
+    return client_key(request.headers.get('X-Forwarded-For'), request.remote_addr)
+
+def submit_transcription(video_id, options=TRANSCRIBE_OPTIONS, client=None):
+    """작업을 큐에 넣고 job_id를 돌려준다. 같은 영상, 같은 옵션의 작업이 이미 대기/실행 중이면 그 작업을 돌려준다."""
+    opts, now = json.dumps(options, sort_keys=True), time.time()
+    with get_db() as db:
+        row = db.execute("SELECT id FROM transcribe_jobs WHERE video_id=? AND options IS ? "
+                         "AND status IN ('queued','running')", (video_id, opts)).fetchone()
+        if row:
+            db.execute("UPDATE transcribe_jobs SET last_seen=? WHERE id=?", (now, row[0]))
+            return row[0]
+        pending = db.execute("SELECT COUNT(*) FROM transcribe_jobs WHERE status='queued'").fetchone()[0]
+        if pending >= TRANSCRIBE_QUEUE_MAX:
+            raise JobError('AI 자막 요청이 많습니다. 잠시 후 다시 시도해주세요.', 503)
+        mine = db.execute("SELECT COUNT(*) FROM transcribe_jobs WHERE status='queued' AND client IS ?",
+                          (client,)).fetchone()[0]
+        if client and mine >= TRANSCRIBE_QUEUE_MAX_PER_CLIENT:
+            raise JobError('이미 요청한 AI 자막이 많습니다. 앞의 작업이 끝난 뒤 다시 시도해주세요.', 429)
+        job_id = uuid.uuid4().hex
+        db.execute("INSERT INTO transcribe_jobs (id, video_id, status, created_at, options, client, last_seen) "
+                   "VALUES (?,?,'queued',?,?,?,?)", (job_id, video_id, now, opts, client, now))
+    ensure_transcribe_dispatcher()
+    _dispatch_wakeup.set()
+    return job_id
+
+def load_job(job_id):
+    with get_db() as db:
+        row = db.execute("SELECT id, status, title, srt, error, error_code FROM transcribe_jobs WHERE id=?",
+                         (job_id,)).fetchone()
+    if not row: return None
+    job = {'job_id': row[0], 'status': row[1]}
+    if row[1] == 'done': job.update(title=row[2], srt_content=row[3])
+    if row[1] == 'running': job.update(title=row[2])
+    if row[1] == 'error': job.update(error=row[4], error_code=row[5])
+    return job
+
+def job_status(job):
+    """작업 응답 본문과 HTTP 상태 코드 (asgi.py도 같이 쓴다)"""
+    code = job.pop('error_code', None)
+    if job['status'] == 'error': return job, code or 500
+    return job, 200 if job['status'] == 'done' else 202
+
+def job_response(job):
+    body, code = job_status(job)
+    return jsonify(body), code
+
+@app.route('/api/whisper-models')
+def whisper_models_status():
+    """풀 프로세스별 Whisper 모델 상태, 로드 시간, 로드로 늘어난 메모리(RSS)"""
+    cols = ("pid", "model", "compute_type", "status", "attempts", "load_sec", "rss_mb", "error", "retry_at", "updated_at")
+    with get_db() as db:
+        rows = [dict(zip(cols, r)) for r in db.execute(
+            f"SELECT {', '.join(cols)} FROM whisper_models ORDER BY model, compute_type, pid")]
+    return jsonify({'prewarm': WHISPER_PREWARM, 'tiers': TRANSCRIBE_TIERS, 'default_tier': TRANSCRIBE_DEFAULT_TIER,
+                    'workers': TRANSCRIBE_WORKERS, 'models': rows})
+
+@app.route('/transcribe/<video_id>', methods=['POST'])
+def transcribe_submit(video_id):
+    """tier(쿼리 또는 폼)로 전사 프리셋을 고른다: fast / balanced / accurate"""
+    try:
+        options = transcribe_options(request.values.get('tier'))
+        cached = lookup_transcript(video_id, options)
+        if cached: return jsonify(cached)
+        job_id = submit_transcription(video_id, options, client_id())
+    except JobError as e:
+        return jsonify({'error': e.message}), e.code
+    return job_response(load_job(job_id))
+
+@app.route('/transcribe/jobs/<job_id>')
+def transcribe_status(job_id):
+    job = load_job(job_id)
+    if not job: return jsonify({'error': '작업을 찾을 수 없습니다.'}), 404
+    if job['status'] in ('queued', 'running'):
+        touch_job(job_id)  # 폴링하는 클라이언트도 지켜보는 것으로 센다
+    if job['status'] == 'queued':
+        ensure_transcribe_dispatcher()  # 디스패처를 돌리던 워커가 죽었으면 이어받는다
+    return job_response(job)
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+SSE_POLL_SEC = 0.5
+
+def poll_job_events(job_id, state):
+    """SSE 스트림의 한 번 조회분: (보낼 이벤트 목록, 스트림을 끝낼지). state는 조회 사이에 이어지는 진행 상태로
+    처음에는 빈 dict를 넘긴다 (Flask 제너레이터와 asgi.py가 같이 쓴다)"""
+    now = time.monotonic()
+    state.setdefault('sent', 0); state.setdefault('last_status', None)
+    state.setdefault('last_write', now); state.setdefault('last_touch', 0)
+    job = load_job(job_id)
+    if not job:
+        return [sse('error', {'error': '작업을 찾을 수 없습니다.'})], True
+    if job['status'] in ('queued', 'running') and now - state['last_touch'] > 5:
+        touch_job(job_id)
+        state['last_touch'] = now
+    with get_db() as db:
+        rows = db.execute("SELECT idx, cue FROM transcribe_cues WHERE job_id=? AND idx>=? ORDER BY idx",
+                          (job_id, state['sent'])).fetchall()
+    events = []
+    for idx, cue in rows:
+        if idx != state['sent']: break  # 아직 기록되지 않은 조각이 있으면 다음 조회에서 이어서 보낸다
+        events.append(sse('cue', {'index': idx, 'cue': cue}))
+        state['sent'] += 1
+    if job['status'] != state['last_status'] and job['status'] in ('queued', 'running'):
+        state['last_status'] = job['status']
+        if job['status'] == 'queued': ensure_transcribe_dispatcher()
+        events.append(sse('status', {'status': job['status'], 'title': job.get('title')}))
+    if job['status'] == 'done':
+        return events + [sse('done', {'title': job['title'], 'srt_content': job['srt_content']})], True
+    if job['status'] == 'error':
+        return events + [sse('error', {'error': job['error']})], True
+    if not events and now - state['last_write'] > 15:
+        events.append(": keepalive\n\n")  # 프록시가 유휴 연결을 끊지 않도록
+    if events: state['last_write'] = now
+    return events, False
+
+@app.route('/transcribe/jobs/<job_id>/stream')
+def transcribe_stream(job_id):
+    """Server-Sent Events: 세그먼트가 디코딩되는 대로 SRT 자막 조각(cue)을 하나씩 보낸다.
+    이벤트: status(대기/실행 상태, 제목), cue(자막 조각), done, error"""
+    if not load_job(job_id): return jsonify({'error': '작업을 찾을 수 없습니다.'}), 404
+
+    def events():
+        # 연결이 끊기면 다음 쓰기에서 제너레이터가 닫히고 touch_job도 멈춘다 → TRANSCRIBE_ABANDON_SEC 뒤 취소
+        state = {}
+        while True:
+            batch, finished = poll_job_events(job_id, state)
+            yield from batch
+            if finished: return
+            cooperative_sleep(SSE_POLL_SEC)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/get-caption-ai/<video_id>')
+def get_caption_ai(video_id):
+    """동기 호환 엔드포인트: 작업을 넣고 끝날 때까지 기다린다. 전사는 풀에서 돌기 때문에 이 스레드는 대기만 한다."""
     try:
-        yt = get_yt_with_retry(video_id)
-        if not yt: abort(500, description="다운로드 실패: 영상 정보 로딩 불가")
+        options = transcribe_options(request.args.get('tier'))
+        cached = lookup_transcript(video_id, options)
+        if cached: return jsonify(cached)
+        job_id = submit_transcription(video_id, options, client_id())
+    except JobError as e:
+        return jsonify({'error': e.message}), e.code
+    deadline = time.time() + TRANSCRIBE_WAIT_TIMEOUT
+    job = load_job(job_id)
+    while job and job['status'] in ('queued', 'running') and time.time() < deadline:
+        cooperative_sleep(1)
+        touch_job(job_id)
+        job = load_job(job_id)
+    if not job: return jsonify({'error': 'AI 자막 실패'}), 500
+    if job['status'] in ('queued', 'running'):
+        return jsonify({'error': 'AI 자막 생성이 지연되고 있습니다.', 'job_id': job_id}), 504
+    return job_response(job)
+
+# --- 영상 다운로드 ---
+def iter_stream_bytes(url, start, end):
+    """스트림 URL의 [start, end] 바이트 구간을 range 요청으로 나눠 받아 조각 단위로 yield"""
+    import urllib.request
+    pos = start
+    while pos <= end:
+        stop = min(pos + DOWNLOAD_RANGE_SIZE - 1, end)
+        req = urllib.request.Request(f"{url}&range={pos}-{stop}", headers={"User-Agent": "Mozilla/5.0"})
+        with PYTUBE_RETRY.call(urllib.request.urlopen, req, timeout=30) as r:
+            before = pos
+            while pos <= stop:
+                chunk = r.read(min(DOWNLOAD_CHUNK_SIZE, stop - pos + 1))
+                if not chunk: break
+                pos += len(chunk)
+                yield chunk
+        if pos == before:
+            raise IOError(f"스트림 응답이 비어 있습니다 (range {pos}-{stop})")
+
+def attachment_header(filename):
+    fallback = filename.encode("ascii", "ignore").decode().strip() or "video.mp4"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+def lookup_cached_video(video_id):
+    with get_db() as db:
+        row = db.execute("SELECT itag, title, path, size FROM video_cache WHERE video_id=?", (video_id,)).fetchone()
+        if not row: return None
+        if not os.path.exists(row[2]):
+            db.execute("DELETE FROM video_cache WHERE video_id=?", (video_id,))
+            return None
+        db.execute("UPDATE video_cache SET last_access=? WHERE video_id=?", (time.time(), video_id))
+    return {'itag': row[0], 'title': row[1], 'path': row[2], 'size': row[3]}
+
+def store_cached_video(video_id, itag, title, path, size):
+    with get_db() as db:
+        db.execute("INSERT OR REPLACE INTO video_cache VALUES (?,?,?,?,?,?)",
+                   (video_id, itag, title, path, size, time.time()))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM video_cache").fetchone()[0]
+        if total <= VIDEO_CACHE_MAX_BYTES: return
+        # 상한을 넘으면 가장 오래 안 쓴 파일부터 지운다 (방금 넣은 파일은 제외)
+        for vid, old_path, sz in db.execute("SELECT video_id, path, size FROM video_cache WHERE video_id != ? "
+                                            "ORDER BY last_access", (video_id,)).fetchall():
+            if total <= VIDEO_CACHE_MAX_BYTES: break
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+            db.execute("DELETE FROM video_cache WHERE video_id=?", (vid,))
+            total -= sz
 
+def send_cached_video(cached):
+    # send_file은 wsgi.file_wrapper(gunicorn에서는 sendfile)로 보내고 ETag/Last-Modified/Range를 처리한다
+    return send_file(cached['path'], as_attachment=True, download_name=f"{cached['title']}.mp4",
+                     mimetype="video/mp4", conditional=True, etag=True)
+
+def resolve_video_stream(video_id):
+    """최고 해상도 progressive 스트림의 주소, 크기, itag, 파일명으로 쓸 제목"""
+    def fetch(yt):
         stream = yt.streams.get_highest_resolution()
         title_safe = ''.join(c for c in yt.title if c.isalnum() or c in (' ','-')).strip()
-        buf = io.BytesIO()
-        stream.stream_to_buffer(buf)
-        buf.seek(0)
-        return send_file(buf, as_attachment=True, download_name=f"{title_safe}.mp4", mimetype="video/mp4")
+        return {'url': stream.url, 'size': stream.filesize, 'itag': stream.itag, 'title': title_safe}
+    return with_yt(video_id, fetch)
+
+# 캐시에 없는 영상은 락을 잡은 요청 하나가 백그라운드 다운로드(fill_video_cache)를 시작하고, 그 영상을 요청한
+# 모든 클라이언트는 채워지는 조각 파일을 처음부터 읽어 간다(tail_video_fill). 다운로드는 클라이언트 연결과 상관없이 끝까지 간다.
+def fill_paths(video_id):
+    """(조각 파일, 스트림 정보 JSON). 락을 잡은 다운로드 하나만 쓰므로 이름에 pid를 넣지 않는다"""
+    base = os.path.join(VIDEO_CACHE_DIR, f"{video_id}.fill")
+    return f"{base}.part", f"{base}.json"
+
+def claim_video_fill(video_id):
+    """이 영상을 받는 다운로드가 없으면 락을 잡고 빈 조각 파일과 스트림 정보를 준비해 (lock, src)를 돌려준다.
+    다른 요청/프로세스가 이미 받고 있거나 그새 캐시에 들어왔으면 None. 스트림 정보를 못 얻으면 예외."""
+    lock = acquire_file_lock(os.path.join(VIDEO_CACHE_DIR, f"{video_id}.lock"))
+    if not lock: return None
+    try:
+        if lookup_cached_video(video_id): return None
+        src = resolve_video_stream(video_id)
+        part, meta = fill_paths(video_id)
+        # 죽은 다운로드가 남긴 조각은 지우고 새로 만든다 (그 조각을 읽던 요청은 링크가 끊긴 것을 보고 멈춘다)
+        if os.path.exists(part): os.remove(part)
+        open(part, "wb").close()
+        with open(f"{meta}.tmp", "w", encoding="utf-8") as f:
+            json.dump(src, f, ensure_ascii=False)
+        os.replace(f"{meta}.tmp", meta)
+        claimed, lock = (lock, src), None
+        return claimed
+    finally:
+        release_file_lock(lock)
+
+def open_video_fill(video_id):
+    """받는 중인 다운로드의 (스트림 정보, 읽기용 조각 파일). 아직 준비 중이거나 이미 끝났으면 None"""
+    part, meta = fill_paths(video_id)
+    try:
+        with open(meta, encoding="utf-8") as f:
+            src = json.load(f)
+        return src, open(part, "rb")
+    except (FileNotFoundError, ValueError):
+        return None
+
+def finish_video_fill(video_id, src):
+    path = os.path.join(VIDEO_CACHE_DIR, f"{video_id}_{src['itag']}.mp4")
+    os.replace(fill_paths(video_id)[0], path)  # 조각을 읽는 요청들은 같은 파일을 계속 읽는다
+    store_cached_video(video_id, src['itag'], src['title'], path, src['size'])
+
+def end_video_fill(video_id, lock):
+    """다운로드를 정리하고 락을 푼다. 조각 파일이 남아 있으면 실패한 것이므로 지운다"""
+    for p in fill_paths(video_id):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+    release_file_lock(lock)
+
+def fill_video_cache(lock, video_id, src):
+    """claim_video_fill이 준비한 조각 파일을 끝까지 채워 캐시에 등록한다 (백그라운드 스레드에서 실행)"""
+    try:
+        with open(fill_paths(video_id)[0], "ab", buffering=0) as f:  # 읽는 쪽이 바로 보도록 버퍼링 없이 쓴다
+            for chunk in iter_stream_bytes(src['url'], 0, src['size'] - 1):
+                f.write(chunk)
+        finish_video_fill(video_id, src)
+    except Exception:
+        logger.exception(f"비디오 캐시 다운로드 실패({video_id})")
+    finally:
+        end_video_fill(video_id, lock)
+
+def fill_stalled(f, idle_since):
+    """조각 파일이 지워졌거나(다운로드 실패) DOWNLOAD_WAIT_TIMEOUT 동안 자라지 않았는지"""
+    return os.fstat(f.fileno()).st_nlink == 0 or time.monotonic() - idle_since > DOWNLOAD_WAIT_TIMEOUT
+
+def tail_video_fill(f, size):
+    """채워지는 중인 조각 파일을 자라는 대로 size바이트까지 읽는다. 다운로드가 중간에 실패하면 IOError"""
+    pos, idle_since = 0, time.monotonic()
+    with f:
+        while pos < size:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, size - pos))
+            if chunk:
+                pos, idle_since = pos + len(chunk), time.monotonic()
+                yield chunk
+            elif fill_stalled(f, idle_since):
+                raise IOError(f"영상 다운로드가 중단되었습니다 ({pos}/{size}바이트)")
+            else:
+                cooperative_sleep(0.2)
+
+@app.route('/download-video/<video_id>')
+def download_video(video_id):
+    """캐시에 있으면 디스크에서 바로 보낸다. 없으면 백그라운드 다운로드를 시작하고 받는 대로 흘려보낸다.
+    같은 영상을 동시에 요청하면 YouTube에서는 한 번만 받고, 모든 요청이 같은 조각 파일을 처음부터 읽어 간다.
+    캐시에 없는 영상의 부분(Range) 요청, 다른 다운로드를 기다리다 시간이 다 된 요청은 YouTube에서 바로 중계한다."""
+    deadline = time.monotonic() + DOWNLOAD_WAIT_TIMEOUT
+    while True:
+        cached = lookup_cached_video(video_id)
+        if cached: return send_cached_video(cached)
+        if request.range or time.monotonic() > deadline: break
+        try:
+            claimed = claim_video_fill(video_id)
+        except Exception:
+            logger.exception(f"비디오 다운로드 오류({video_id})")
+            return redirect(f"https://youtu.be/{video_id}")
+        if claimed:
+            threading.Thread(target=fill_video_cache, args=(claimed[0], video_id, claimed[1]),
+                             name=f"fill-{video_id}", daemon=True).start()
+        filling = open_video_fill(video_id)
+        if filling:
+            src, f = filling
+            return stream_video(video_id, src, tail_video_fill(f, src['size']), 0, src['size'] - 1, 200)
+        if not claimed: cooperative_sleep(0.2)  # 다른 요청이 스트림 정보를 받는 중이다
+
+    try:
+        src = resolve_video_stream(video_id)
     except Exception:
         logger.exception(f"비디오 다운로드 오류({video_id})")
         return redirect(f"https://youtu.be/{video_id}")
+    size = src['size']
+    start, end, status = 0, size - 1, 200
+    if request.range:
+        r = request.range.range_for_length(size)
+        if r is None:
+            return Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+        start, end, status = r[0], r[1] - 1, 206
+    return stream_video(video_id, src, iter_stream_bytes(src['url'], start, end), start, end, status)
+
+def stream_video(video_id, src, chunks, start, end, status):
+    headers = {"Accept-Ranges": "bytes", "Content-Disposition": attachment_header(f"{src['title']}.mp4"),
+               "Content-Length": str(end - start + 1)}
+    if status == 206:
+        headers["Content-Range"] = f"bytes {start}-{end}/{src['size']}"
+
+    def body():
+        try:
+            yield from chunks
+        except Exception:
+            # 헤더는 이미 나갔으므로 연결을 끊는 수밖에 없다. 클라이언트는 Range로 이어받을 수 있다
+            logger.exception(f"비디오 스트리밍 중단({video_id})")
+            raise
+        finally:
+            chunks.close()
+
+    return Response(stream_with_context(body()), status=status, headers=headers, mimetype="video/mp4")
+
+if TRANSCRIBE_START_AT_BOOT:
+    ensure_transcribe_dispatcher()  # 락을 못 잡은 워커는 아무것도 하지 않는다
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "10000"))
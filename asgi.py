@@ -0,0 +1,449 @@
+# asgi.py
+# 비동기(ASGI) 실행 모드: uvicorn asgi:app --host 0.0.0.0 --port $PORT
+# /analyze, /get-caption, /download-video는 이벤트 루프에서 돌고, Data API와 영상 바이트는 httpx.AsyncClient로 받는다.
+# 느린 YouTube 호출이 워커 스레드를 붙잡지 않으므로 프로세스 하나가 수백 개의 호출을 동시에 기다릴 수 있다.
+# AI 자막 작업을 기다리는 라우트(작업 상태, SSE 스트림, /get-caption-ai)도 asyncio.sleep으로 기다린다.
+# 나머지 URL(작업 등록, /api/quota 등)은 기존 Flask 앱을 그대로 붙여 처리하고, 캐시 DB/할당량/키 순환은 app.py와 공유한다.
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from urllib.parse import quote
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from flask import render_template
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_range_header
+
+import app as core
+
+logger = core.logger
+
+ASYNC_MAX_CONNECTIONS = int(os.getenv("ASYNC_MAX_CONNECTIONS", 200))  # httpx 연결 풀 크기
+ASYNC_BLOCKING_WORKERS = int(os.getenv("ASYNC_BLOCKING_WORKERS", 32))  # pytubefix 등 동기 작업용 스레드
+ASYNC_DB_WORKERS = int(os.getenv("ASYNC_DB_WORKERS", 8))  # 캐시 DB(SQLite) 작업 전용 스레드
+# 아래 Route에 없는 기존 Flask 라우트를 돌리는 스레드 수. 응답을 다 보낼 때까지 스레드 하나를 쓰므로
+# 오래 걸리는 요청이 이만큼 겹치면 나머지 Flask 라우트('/', /api/quota 등)가 기다린다.
+# 그래서 오래 기다리는 AI 자막 라우트(작업 상태, SSE, /get-caption-ai)는 여기서 비동기로 처리한다
+ASYNC_WSGI_WORKERS = int(os.getenv("ASYNC_WSGI_WORKERS", 10))
+DATA_API_BASE = "https://www.googleapis.com/youtube/v3"
+
+_http = None  # lifespan에서 만든다
+# SQLite 쓰기 락은 다른 워커/디스패처가 잡고 있으면 최대 30초 기다리므로 이벤트 루프에서 부르지 않는다.
+# pytubefix 호출에 밀리지 않도록 기본 executor와 따로 둔다
+_db_pool = ThreadPoolExecutor(max_workers=ASYNC_DB_WORKERS, thread_name_prefix="asgi-db")
+
+async def in_db(fn, *args):
+    """캐시 DB/할당량을 읽고 쓰는 app.py 함수를 DB 전용 스레드에서 부른다"""
+    return await asyncio.get_running_loop().run_in_executor(_db_pool, fn, *args)
+
+async def acquire_file_lock(path, timeout):
+    """app.acquire_file_lock의 비동기판. 스레드를 붙잡지 않고 비차단 flock을 asyncio.sleep 사이사이 다시 시도한다"""
+    deadline = time.monotonic() + timeout
+    while True:
+        f = core.acquire_file_lock(path)
+        if f or time.monotonic() >= deadline: return f
+        await asyncio.sleep(0.2)
+
+# --- Data API (비동기) ---
+class ApiHttpError(Exception):
+    """Data API 오류 응답. googleapiclient HttpError처럼 resp.status와 content를 가지므로
+    app.py의 is_quota_error/is_key_error/DATA_API_RETRY 판별을 그대로 쓴다."""
+    def __init__(self, status, content):
+        super().__init__(f"HTTP {status}: {content[:200].decode('utf-8', 'ignore')}")
+        self.resp, self.content = SimpleNamespace(status=status), content
+
+_key_slots = {}
+
+def key_slot(key):
+    if key not in _key_slots:
+        _key_slots[key] = asyncio.Semaphore(core.API_KEY_CONCURRENCY)
+    return _key_slots[key]
+
+async def api_get(resource, etag_key=None, **params):
+    """app.api_execute의 비동기판. resource.list를 REST로 부르고 ETag 재검증, 할당량 기록, 키 순환을 똑같이 한다."""
+    cost = core.QUOTA_COSTS.get(f"youtube.{resource}.list", 1)
+    cached = await in_db(core.lookup_api_etag, etag_key) if etag_key else None
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    params = {k: v for k, v in params.items() if v is not None}
+    tried = set()
+    while True:
+        key = await in_db(core.api_keys.pick, cost, tried)
+        if key is None:
+            raise core.QuotaExhausted("남은 할당량이 있는 API 키가 없습니다")
+        tried.add(key)
+        started, attempts = time.monotonic(), 0
+
+        async def attempt():
+            nonlocal attempts
+            attempts += 1
+            async with key_slot(key):
+                r = await _http.get(f"{DATA_API_BASE}/{resource}", params={**params, "key": key}, headers=headers)
+            if r.status_code >= 300:
+                raise ApiHttpError(r.status_code, r.content)
+            return r.json()
+        try:
+            body = await core.DATA_API_RETRY.acall(attempt)
+        except Exception as e:
+            latency = time.monotonic() - started
+            if cached and core.google_http_status(e) == 304:
+                core.api_keys.record(key, latency)
+                await in_db(core.touch_api_etag, etag_key)
+                return json.loads(cached[1])
+            core.api_keys.record(key, latency, e)
+            if await in_db(core.on_api_error, key, e, cost, attempts): continue
+            raise
+        core.api_keys.record(key, time.monotonic() - started)
+        await in_db(core.record_quota, key, cost * attempts)
+        break
+    if etag_key: await in_db(core.store_api_etag, etag_key, body)
+    return body
+
+# --- 채널 URL → 채널 ID ---
+async def scrape_channel_id(url):
+    async with _http.stream("GET", url, headers={"User-Agent": "Mozilla/5.0", "Accept-Language": "ko"}) as r:
+        html = b""
+        async for chunk in r.aiter_bytes():
+            html += chunk
+            if len(html) >= 512 * 1024: break
+    m = core.CANONICAL_CHANNEL_RE.search(html.decode("utf-8", "ignore"))
+    return m.group(1) if m else None
+
+async def resolve_channel_id(kind, value):
+    if kind == "handle":
+        return core._first_id(await api_get("channels", part="id", forHandle=value))
+    if kind == "user":
+        return core._first_id(await api_get("channels", part="id", forUsername=value))
+    if kind == "video":
+        items = (await api_get("videos", part="snippet", id=value)).get("items") or []
+        return items[0]["snippet"]["channelId"] if items else None
+    if kind == "custom":
+        cid = (core._first_id(await api_get("channels", part="id", forHandle=value))
+               or core._first_id(await api_get("channels", part="id", forUsername=value)))
+        return cid or await scrape_channel_id(f"https://www.youtube.com/c/{quote(value)}")
+    return None
+
+async def extract_channel_id(url):
+    parsed = core.parse_channel_url(url)
+    if not parsed: return None
+    kind, value = parsed
+    if kind == "channel": return value
+    cid = await in_db(core.lookup_channel_index, kind, value)
+    if cid: return cid
+    try:
+        cid = await resolve_channel_id(kind, value)
+    except Exception as e:
+        if core.is_quota_error(e): raise
+        logger.exception(f"채널 ID 추출 실패: {url}")
+        return None
+    if cid: await in_db(core.store_channel_index, kind, value, cid)
+    return cid
+
+# --- 영상 목록 ---
+async def iter_upload_ids(uploads, max_v=core.MAX_VIDEOS, known=None):
+    token, seen = None, 0
+    while seen < max_v:
+        r = await api_get("playlistItems", etag_key=f"playlistItems:{uploads}:{token or ''}",
+                          part="snippet", playlistId=uploads, maxResults=50, pageToken=token)
+        ids = [i["snippet"]["resourceId"]["videoId"] for i in r.get("items", [])][:max_v - seen]
+        if known:
+            hit = next((n for n, vid in enumerate(ids) if vid in known), None)
+            if hit is not None:
+                if hit: yield ids[:hit]
+                return
+        seen += len(ids)
+        if ids: yield ids
+        token = r.get("nextPageToken")
+        if not token: return
+
+async def fetch_video_batch(ids):
+    batch = ",".join(ids)
+    r = await api_get("videos", etag_key=f"videos:{hashlib.sha1(batch.encode()).hexdigest()}",
+                      part="snippet,statistics,contentDetails", id=batch)
+    found = {v["id"]: core.parse_video(v) for v in r.get("items", [])}
+    return [found[vid] for vid in ids if vid in found]
+
+async def gather_batches(batches):
+    """videos.list 배치들을 동시에 보낸다 (키별 세마포어가 동시 요청 수를 제한한다). 하나가 실패하면 나머지는 취소."""
+    tasks = [asyncio.ensure_future(b) for b in batches]
+    try:
+        return [v for vs in await asyncio.gather(*tasks) for v in vs]
+    finally:
+        for t in tasks: t.cancel()
+
+async def fetch_videos(uploads, max_v=core.MAX_VIDEOS):
+    # 재생목록 다음 페이지를 받는 동안 앞 페이지의 videos.list가 이미 돌고 있다
+    tasks = []
+    try:
+        async for page in iter_upload_ids(uploads, max_v):
+            tasks.append(asyncio.ensure_future(fetch_video_batch(page)))
+    except BaseException:
+        for t in tasks: t.cancel()
+        raise
+    return await gather_batches(tasks)
+
+async def sync_videos(uploads, cached, max_v=core.MAX_VIDEOS):
+    new_ids = [vid async for page in iter_upload_ids(uploads, max_v, known={v["id"] for v in cached}) for vid in page]
+    recent = [v["id"] for v in cached[:max(core.SYNC_REFRESH_RECENT - len(new_ids), 0)]]
+    ids = new_ids + recent
+    fresh = await gather_batches(fetch_video_batch(ids[i:i+50]) for i in range(0, len(ids), 50))
+    checked = set(new_ids) | set(recent)
+    return (fresh + [v for v in cached if v["id"] not in checked])[:core.MAX_VIDEOS]
+
+# --- 채널 스냅샷 ---
+_flights = {}
+
+async def single_flight(key, fn, *args):
+    """app.SingleFlight의 asyncio판. 갱신은 별도 태스크로 돌아 먼저 온 요청이 끊겨도 기다리는 요청들은 결과를 받는다."""
+    task = _flights.get(key)
+    if task is None:
+        task = _flights[key] = asyncio.ensure_future(fn(*args))
+        task.add_done_callback(lambda _: _flights.pop(key, None))
+    return await asyncio.shield(task)
+
+async def get_channel_snapshot(cid):
+    snap = await in_db(core.load_channel_snapshot, cid)
+    if core.is_fresh(snap):
+        return snap
+    if snap and await in_db(core.quota_low):
+        logger.warning(f"할당량 부족으로 오래된 캐시 사용 ({cid})")
+        return snap
+    return await single_flight(cid, refresh_channel_snapshot, cid)
+
+async def refresh_channel_snapshot(cid):
+    # 다른 워커 프로세스(Flask 포함)와는 app.py와 같은 파일 락으로 한 번만 갱신한다
+    lock = await acquire_file_lock(core.channel_lock_path(cid), core.CHANNEL_REFRESH_WAIT)
+    try:
+        snap = await in_db(core.load_channel_snapshot, cid)
+        if core.is_fresh(snap):
+            return snap
+        return await fetch_channel_snapshot(cid, snap)
+    finally:
+        core.release_file_lock(lock)
+
+async def fetch_channel_snapshot(cid, snap):
+    info = (await api_get("channels", etag_key=f"channels:{cid}",
+                          part="snippet,statistics,contentDetails", id=cid))["items"][0]
+    uploads = info["contentDetails"]["relatedPlaylists"]["uploads"]
+    degraded = await in_db(core.quota_low)
+    max_v = core.QUOTA_DEGRADED_MAX_VIDEOS if degraded else core.MAX_VIDEOS
+    try:
+        if core.INCREMENTAL_SYNC and snap and snap["videos"] and (
+                degraded or time.time() - snap["full_synced_at"] < core.FULL_SYNC_TTL):
+            videos, full_synced_at = await sync_videos(uploads, snap["videos"], max_v), snap["full_synced_at"]
+        else:
+            videos, full_synced_at = await fetch_videos(uploads, max_v), time.time()
+    except Exception:
+        logger.exception("동영상 목록 로딩 중 오류")
+        return core.unsaved_snapshot(info, snap)
+    return await in_db(core.save_channel_snapshot, cid, info, videos, 0 if degraded else full_synced_at)
+
+# --- 라우트 ---
+def render(template, **context):
+    # 템플릿은 Flask 앱의 Jinja 환경(필터 포함)으로 그린다
+    with core.app.app_context():
+        return HTMLResponse(render_template(template, **context))
+
+async def analyze(request):
+    url, sort_by, page = core.analyze_params(request.query_params)
+    if not url: return render('index.html', error="URL을 입력해주세요.")
+    try:
+        cid = await extract_channel_id(url)
+        if not cid: return render('index.html', error="유효하지 않은 채널 URL입니다.")
+        snap = await get_channel_snapshot(cid)
+    except Exception as e:
+        return render('index.html', error=core.analyze_error(e))
+    with core.app.app_context():
+        return HTMLResponse(core.render_analysis(snap, url, sort_by, page))
+
+async def get_caption(request):
+    # pytubefix는 동기 라이브러리라 스레드에서 돌린다 (캐시 적중은 금방 끝난다)
+    payload, status = await asyncio.to_thread(core.load_caption, request.path_params["video_id"])
+    return JSONResponse(payload, status_code=status)
+
+async def iter_stream_bytes(url, start, end):
+    """app.iter_stream_bytes의 비동기판"""
+    pos = start
+    while pos <= end:
+        stop = min(pos + core.DOWNLOAD_RANGE_SIZE - 1, end)
+
+        async def open_range():
+            r = await _http.send(_http.build_request("GET", f"{url}&range={pos}-{stop}"), stream=True)
+            if r.status_code >= 400:
+                await r.aclose()
+                r.raise_for_status()
+            return r
+        r = await core.PYTUBE_RETRY.acall(open_range)
+        before = pos
+        try:
+            async for chunk in r.aiter_bytes(core.DOWNLOAD_CHUNK_SIZE):
+                chunk = chunk[:stop - pos + 1]
+                pos += len(chunk)
+                yield chunk
+                if pos > stop: break
+        finally:
+            await r.aclose()
+        if pos == before:
+            raise IOError(f"스트림 응답이 비어 있습니다 (range {pos}-{stop})")
+
+_fills = set()  # 백그라운드 다운로드 태스크 (참조를 들고 있어야 중간에 수거되지 않는다)
+
+async def fill_video_cache(lock, video_id, src):
+    """app.fill_video_cache의 비동기판"""
+    try:
+        with open(core.fill_paths(video_id)[0], "ab", buffering=0) as f:
+            async for chunk in iter_stream_bytes(src['url'], 0, src['size'] - 1):
+                f.write(chunk)
+        await in_db(core.finish_video_fill, video_id, src)
+    except Exception:
+        logger.exception(f"비디오 캐시 다운로드 실패({video_id})")
+    finally:
+        await in_db(core.end_video_fill, video_id, lock)
+
+async def tail_video_fill(f, size):
+    """app.tail_video_fill의 비동기판"""
+    pos, idle_since = 0, time.monotonic()
+    with f:
+        while pos < size:
+            chunk = f.read(min(core.DOWNLOAD_CHUNK_SIZE, size - pos))
+            if chunk:
+                pos, idle_since = pos + len(chunk), time.monotonic()
+                yield chunk
+            elif core.fill_stalled(f, idle_since):
+                raise IOError(f"영상 다운로드가 중단되었습니다 ({pos}/{size}바이트)")
+            else:
+                await asyncio.sleep(0.2)
+
+def cached_video_response(cached):
+    # FileResponse가 Range/ETag를 처리하고 sendfile로 보낸다
+    return FileResponse(cached['path'], media_type="video/mp4", filename=f"{cached['title']}.mp4")
+
+def stream_video(src, chunks, start, end, status):
+    headers = {"Accept-Ranges": "bytes", "Content-Disposition": core.attachment_header(f"{src['title']}.mp4"),
+               "Content-Length": str(end - start + 1)}
+    if status == 206:
+        headers["Content-Range"] = f"bytes {start}-{end}/{src['size']}"
+    return StreamingResponse(chunks, status_code=status, headers=headers, media_type="video/mp4")
+
+async def download_video(request):
+    # app.download_video와 같은 흐름. 다운로드는 이벤트 루프의 태스크로 돌고 기다리는 요청은 asyncio.sleep으로 기다린다
+    video_id = request.path_params["video_id"]
+    rng = parse_range_header(request.headers.get("range"))
+    deadline = time.monotonic() + core.DOWNLOAD_WAIT_TIMEOUT
+    while True:
+        cached = await in_db(core.lookup_cached_video, video_id)
+        if cached: return cached_video_response(cached)
+        if rng or time.monotonic() > deadline: break
+        try:
+            claimed = await asyncio.to_thread(core.claim_video_fill, video_id)
+        except Exception:
+            logger.exception(f"비디오 다운로드 오류({video_id})")
+            return RedirectResponse(f"https://youtu.be/{video_id}")
+        if claimed:
+            task = asyncio.ensure_future(fill_video_cache(claimed[0], video_id, claimed[1]))
+            _fills.add(task)
+            task.add_done_callback(_fills.discard)
+        filling = core.open_video_fill(video_id)
+        if filling:
+            src, f = filling
+            return stream_video(src, tail_video_fill(f, src['size']), 0, src['size'] - 1, 200)
+        if not claimed: await asyncio.sleep(0.2)
+
+    try:
+        src = await asyncio.to_thread(core.resolve_video_stream, video_id)
+    except Exception:
+        logger.exception(f"비디오 다운로드 오류({video_id})")
+        return RedirectResponse(f"https://youtu.be/{video_id}")
+    size = src['size']
+    start, end, status = 0, size - 1, 200
+    if rng:
+        r = rng.range_for_length(size)
+        if r is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        start, end, status = r[0], r[1] - 1, 206
+    return stream_video(src, iter_stream_bytes(src['url'], start, end), start, end, status)
+
+# --- AI 자막 작업 ---
+def client_id(request):
+    return core.client_key(request.headers.get("x-forwarded-for"), request.client.host if request.client else None)
+
+def job_response(job):
+    body, code = core.job_status(job)
+    return JSONResponse(body, status_code=code)
+
+async def transcribe_status(request):
+    job_id = request.path_params["job_id"]
+    job = await in_db(core.load_job, job_id)
+    if not job: return JSONResponse({'error': '작업을 찾을 수 없습니다.'}, status_code=404)
+    if job['status'] in ('queued', 'running'):
+        await in_db(core.touch_job, job_id)
+    if job['status'] == 'queued':
+        await in_db(core.ensure_transcribe_dispatcher)
+    return job_response(job)
+
+async def transcribe_stream(request):
+    """app.transcribe_stream의 비동기판. 조회 사이에는 스레드를 쓰지 않고 asyncio.sleep으로 기다린다.
+    연결이 끊기면 Starlette가 제너레이터를 취소하므로 touch_job도 멈춘다."""
+    job_id = request.path_params["job_id"]
+    if not await in_db(core.load_job, job_id):
+        return JSONResponse({'error': '작업을 찾을 수 없습니다.'}, status_code=404)
+
+    async def events():
+        state = {}
+        while True:
+            batch, finished = await in_db(core.poll_job_events, job_id, state)
+            for event in batch:
+                yield event
+            if finished: return
+            await asyncio.sleep(core.SSE_POLL_SEC)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=core.SSE_HEADERS)
+
+async def get_caption_ai(request):
+    """app.get_caption_ai의 비동기판"""
+    video_id = request.path_params["video_id"]
+    try:
+        options = core.transcribe_options(request.query_params.get('tier'))
+        cached = await in_db(core.lookup_transcript, video_id, options)
+        if cached: return JSONResponse(cached)
+        job_id = await in_db(core.submit_transcription, video_id, options, client_id(request))
+    except core.JobError as e:
+        return JSONResponse({'error': e.message}, status_code=e.code)
+    deadline = time.time() + core.TRANSCRIBE_WAIT_TIMEOUT
+    job = await in_db(core.load_job, job_id)
+    while job and job['status'] in ('queued', 'running') and time.time() < deadline:
+        await asyncio.sleep(1)
+        await in_db(core.touch_job, job_id)
+        job = await in_db(core.load_job, job_id)
+    if not job: return JSONResponse({'error': 'AI 자막 실패'}, status_code=500)
+    if job['status'] in ('queued', 'running'):
+        return JSONResponse({'error': 'AI 자막 생성이 지연되고 있습니다.', 'job_id': job_id}, status_code=504)
+    return job_response(job)
+
+@asynccontextmanager
+async def lifespan(_):
+    global _http
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_WORKERS, thread_name_prefix="asgi-blocking"))
+    limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_CONNECTIONS // 4)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30, connect=10), limits=limits, follow_redirects=True) as _http:
+        yield
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route("/analyze", analyze),
+    Route("/get-caption/{video_id}", get_caption),
+    Route("/download-video/{video_id}", download_video),
+    Route("/transcribe/jobs/{job_id}", transcribe_status),
+    Route("/transcribe/jobs/{job_id}/stream", transcribe_stream),
+    Route("/get-caption-ai/{video_id}", get_caption_ai),
+    # 나머지는 기존 Flask 라우트 (ASYNC_WSGI_WORKERS개 스레드에서 실행)
+    Mount("/", app=WSGIMiddleware(core.app, workers=ASYNC_WSGI_WORKERS)),
+])
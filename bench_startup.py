@@ -0,0 +1,104 @@
+# bench_startup.py
+# 워커 콜드 스타트 비용 측정: python bench_startup.py
+
+import os
+import sys
+import json
+import pickle
+import time
+import subprocess
+
+os.environ.setdefault("YOUTUBE_API_KEY", "bench")
+os.environ.setdefault("TRANSCRIBE_START_AT_BOOT", "false")  # 측정 중에 전사 풀을 띄우지 않는다
+
+HEAVY_MODULES = ["googleapiclient.discovery", "pytubefix", "faster_whisper"]
+
+# 새 인터프리터에서 import 1개의 시간과 RSS 증가량을 잰다
+_IMPORT_PROBE = """
+import sys, time, importlib
+def rss_kb():
+    with open("/proc/self/status") as f:
+        return next(int(l.split()[1]) for l in f if l.startswith("VmRSS"))
+before = rss_kb(); t = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(f"{(time.perf_counter() - t) * 1000:.1f} {(rss_kb() - before) / 1024:.1f}")
+"""
+
+# app을 띄우고 '/'와 '/analyze'를 처리할 때마다 무거운 모듈이 올라왔는지 확인한다.
+# '/analyze'는 채널 해석, 영상 목록 갱신, 렌더링까지 실제 경로를 타고 Data API 응답만 흉내 낸다 (네트워크/할당량 안 씀)
+_WORKER_PROBE = """
+import os, sys, json, tempfile
+os.environ["DATA_DIR"] = tempfile.mkdtemp()
+import app
+CHANNEL = {"id": "UCbenchbenchbenchbenchbe", "snippet": {"title": "bench", "description": "",
+           "publishedAt": "2020-01-01T00:00:00Z", "thumbnails": {"high": {"url": ""}}},
+           "statistics": {"subscriberCount": "1000"}, "contentDetails": {"relatedPlaylists": {"uploads": "UUbench"}}}
+VIDEO = {"id": "bench000000", "snippet": {"title": "bench", "publishedAt": "2024-01-01T00:00:00Z"},
+         "statistics": {"viewCount": "10"}, "contentDetails": {"duration": "PT1M"}}
+RESPONSES = {"youtube.channels.list": {"items": [CHANNEL]},
+             "youtube.playlistItems.list": {"items": [{"snippet": {"resourceId": {"videoId": VIDEO["id"]}}}]},
+             "youtube.videos.list": {"items": [VIDEO]}}
+app.api_execute = lambda req, etag_key=None: RESPONSES[req.methodId]
+c = app.app.test_client()
+loaded = {}
+for path in ("/", "/analyze?url=@bench"):
+    r = c.get(path)
+    assert r.status_code == 200, (path, r.status_code)
+    assert path == "/" or "bench - 분석 결과".encode() in r.data, "분석 페이지가 아닌 오류 페이지가 나왔습니다"
+    loaded[path] = {m: m in sys.modules for m in sys.argv[1:]}
+print(json.dumps(loaded))
+"""
+
+def timed(label, fn, repeat=20):
+    fn()  # 워밍업
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    ms = (time.perf_counter() - t) / repeat * 1000
+    print(f"{label:<40} {ms:8.2f} ms")
+
+def run_probe(code, *args):
+    out = subprocess.run([sys.executable, "-c", code, *args], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    if out.returncode:
+        return None, out.stderr.strip().splitlines()[-1]
+    return out.stdout.strip(), None
+
+def bench_imports():
+    print(f"{'모듈':<30} {'import(ms)':>10} {'RSS(MB)':>9}")
+    for m in ["flask", *HEAVY_MODULES, "app"]:
+        out, err = run_probe(_IMPORT_PROBE, m)
+        if err:
+            print(f"{m:<30} 실패: {err}")
+            continue
+        ms, mb = out.split()
+        print(f"{m:<30} {float(ms):>10.1f} {float(mb):>9.1f}")
+
+def check_lazy_imports():
+    out, err = run_probe(_WORKER_PROBE, *HEAVY_MODULES)
+    if err:
+        print(f"지연 import 확인 실패: {err}")
+        return
+    for path, modules in json.loads(out).items():
+        for m, loaded in modules.items():
+            print(f"{path} 처리 후 {m}: {'로드됨' if loaded else '로드 안 됨'}")
+
+def bench_discovery():
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+    import app
+
+    raw = get_static_doc("youtube", "v3")
+    blob = pickle.dumps(json.loads(raw), protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"youtube.v3 discovery 문서: {len(raw) / 1024:.0f} KB")
+    timed("json.loads (매번 파싱)", lambda: json.loads(raw))
+    timed("pickle.loads (파싱된 사본)", lambda: pickle.loads(blob))
+    timed("build_from_document(str)", lambda: build_from_document(raw, developerKey="bench"))
+    timed("app.build_youtube_client()", app.build_youtube_client)
+
+if __name__ == "__main__":
+    bench_imports()
+    print()
+    check_lazy_imports()
+    print()
+    bench_discovery()
@@ -0,0 +1,79 @@
+# bench_vad.py
+# VAD(음성 구간만 디코딩) 전후 전사 시간 비교: python bench_vad.py [--tier balanced] [--repeat 1] 파일|영상ID ...
+# 인자가 11자 영상 ID이면 pytubefix로 오디오를 받아 쓴다. 토크/인터뷰 형식 영상 몇 개로 돌려 보면 된다.
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+os.environ.setdefault("YOUTUBE_API_KEY", "bench")
+os.environ.setdefault("TRANSCRIBE_START_AT_BOOT", "false")
+
+SAMPLE_RATE = 16000
+
+def fetch_audio(arg, tmpdir):
+    if os.path.exists(arg):
+        return arg
+    import app
+    stream = app.with_yt(arg, lambda yt: yt.streams.filter(only_audio=True, file_extension="mp4").first())
+    return stream.download(output_path=tmpdir, filename=f"{arg}.mp4")
+
+def decode(model, audio, opts, vad):
+    t = time.perf_counter()
+    segs, info = model.transcribe(audio, beam_size=opts["beam_size"], language=opts["language"],
+                                  vad_filter=vad, vad_parameters=opts["vad_parameters"] if vad else None)
+    n = sum(1 for _ in segs)  # 세그먼트는 지연 생성되므로 끝까지 소비해야 디코딩이 끝난다
+    return time.perf_counter() - t, n, info
+
+def bench_file(model, path, opts, repeat):
+    from faster_whisper import decode_audio
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    audio = decode_audio(path, sampling_rate=SAMPLE_RATE)  # 디코딩 비용은 양쪽에서 빼고 잰다
+    duration = len(audio) / SAMPLE_RATE
+    t = time.perf_counter()
+    speech = get_speech_timestamps(audio, VadOptions(**opts["vad_parameters"]))
+    vad_sec = time.perf_counter() - t
+    speech_sec = sum(s["end"] - s["start"] for s in speech) / SAMPLE_RATE
+
+    results = {}
+    for vad in (False, True):
+        runs = [decode(model, audio, opts, vad) for _ in range(repeat)]
+        results[vad] = (min(r[0] for r in runs), runs[0][1])
+    (off, n_off), (on, n_on) = results[False], results[True]
+    print(f"{os.path.basename(path)}")
+    print(f"  길이 {duration:7.1f}초 · 음성 {speech_sec:7.1f}초 ({speech_sec / duration:.0%}) · VAD 자체 {vad_sec:.2f}초")
+    print(f"  VAD 끔 {off:7.1f}초 (RTF {off / duration:.3f}, 세그먼트 {n_off})")
+    print(f"  VAD 켬 {on:7.1f}초 (RTF {on / duration:.3f}, 세그먼트 {n_on})  → {1 - on / off:.0%} 절감")
+    return duration, off, on
+
+def main():
+    import app
+    import transcriber
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="+", help="오디오/영상 파일 경로 또는 YouTube 영상 ID")
+    parser.add_argument("--tier", default=app.TRANSCRIBE_DEFAULT_TIER, choices=list(app.TRANSCRIBE_TIERS))
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    opts = app.TRANSCRIBE_TIERS[args.tier]
+    print(f"tier={args.tier} model={opts['model']} beam_size={opts['beam_size']} vad_parameters={opts['vad_parameters']}")
+    transcriber.init_worker(app.WHISPER_CACHE_DIR, None)
+    t = time.perf_counter()
+    model = transcriber.get_whisper_model(*app.model_args(opts))
+    print(f"모델 로드 {time.perf_counter() - t:.1f}초 (측정에서 제외)\n")
+
+    totals = [0.0, 0.0, 0.0]
+    with tempfile.TemporaryDirectory() as td:
+        for arg in args.inputs:
+            for i, v in enumerate(bench_file(model, fetch_audio(arg, td), opts, args.repeat)):
+                totals[i] += v
+    duration, off, on = totals
+    if len(args.inputs) > 1:
+        print(f"\n합계: 오디오 {duration:.0f}초, VAD 끔 {off:.1f}초 → 켬 {on:.1f}초 ({1 - on / off:.0%} 절감)")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# tests/test_app.py
+# app.py의 순수 함수 테스트: python -m unittest discover tests
+
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("YOUTUBE_API_KEY", "test")
+os.environ.setdefault("TRANSCRIBE_START_AT_BOOT", "false")
+os.environ["DATA_DIR"] = tempfile.mkdtemp()
+
+import app
+
+CID = "UC" + "a1B2c3D4e5F6g7H8i9J0-_"
+
+class ParseChannelUrlTest(unittest.TestCase):
+    def check(self, url, expected):
+        self.assertEqual(app.parse_channel_url(url), expected, url)
+
+    def test_channel_id(self):
+        self.check(CID, ("channel", CID))
+        self.check(f"  {CID}\n", ("channel", CID))
+        self.check(f"https://www.youtube.com/channel/{CID}", ("channel", CID))
+        self.check(f"youtube.com/channel/{CID}/videos", ("channel", CID))
+        self.check(f"https://m.youtube.com/channel/{CID}?feature=share", ("channel", CID))
+
+    def test_invalid_channel_id(self):
+        self.check("https://www.youtube.com/channel/UCshort", None)
+        self.check(f"https://www.youtube.com/channel/{CID}x", None)
+        self.check(f"https://www.youtube.com/channel/{CID}%0A", None)
+        self.check("https://www.youtube.com/channel/x%2F..%2F..%2F..%2Fescaped%2Fpwned", None)
+        self.check("https://www.youtube.com/channel/..%2F" + CID[3:], None)
+
+    def test_handle(self):
+        self.check("@Foo", ("handle", "foo"))
+        self.check("@Foo/videos", ("handle", "foo"))
+        self.check("https://www.youtube.com/@Foo", ("handle", "foo"))
+        self.check("https://music.youtube.com/@Foo/featured", ("handle", "foo"))
+        self.check("https://www.youtube.com/%40%ED%95%9C%EA%B8%80", ("handle", "한글"))
+
+    def test_user_and_custom(self):
+        self.check("https://www.youtube.com/user/OldName", ("user", "OldName"))
+        self.check("https://www.youtube.com/c/Custom%20Name", ("custom", "Custom Name"))
+        self.check("https://www.youtube.com/LegacyName", ("custom", "LegacyName"))
+        self.check("youtube.com/%ED%95%9C%EA%B8%80%EC%B1%84%EB%84%90", ("custom", "한글채널"))
+
+    def test_reserved_and_non_channel_paths(self):
+        for path in ("feed", "premium", "Gaming", "hashtag", "about", "t"):
+            self.check(f"https://www.youtube.com/{path}", None)
+        self.check("https://www.youtube.com/robots.txt", None)
+        self.check("https://www.youtube.com/ab", None)
+        self.check("https://www.youtube.com/", None)
+        self.check("https://www.youtube.com/feed/subscriptions", None)
+
+    def test_video(self):
+        self.check("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1", ("video", "dQw4w9WgXcQ"))
+        self.check("https://youtu.be/dQw4w9WgXcQ", ("video", "dQw4w9WgXcQ"))
+        self.check("https://www.youtube.com/shorts/dQw4w9WgXcQ", ("video", "dQw4w9WgXcQ"))
+        self.check("https://www.youtube.com/live/dQw4w9WgXcQ", ("video", "dQw4w9WgXcQ"))
+        self.check("https://www.youtube.com/embed/dQw4w9WgXcQ", ("video", "dQw4w9WgXcQ"))
+        self.check("https://www.youtube.com/watch", None)
+        self.check("https://youtu.be/", None)
+
+    def test_other_hosts(self):
+        self.check("https://example.com/@Foo", None)
+        self.check("https://notyoutube.com/channel/" + CID, None)
+        self.check("plain words", None)
+
+class ChannelLockPathTest(unittest.TestCase):
+    def test_valid_id(self):
+        self.assertEqual(app.channel_lock_path(CID), os.path.join(app.DATA_DIR, "locks", f"channel_{CID}.lock"))
+
+    def test_rejects_paths(self):
+        for cid in ("x/../../escaped/pwned", "../" + CID, CID + "\n", ""):
+            with self.assertRaises(ValueError):
+                app.channel_lock_path(cid)
+
+    def test_analyze_does_not_touch_files_outside_data_dir(self):
+        url = "https://www.youtube.com/channel/x%2F..%2F..%2F..%2Fescaped%2Fpwned"
+        r = app.app.test_client().get("/analyze", query_string={"url": url})
+        self.assertEqual(r.status_code, 200)
+        self.assertIn("유효하지 않은 채널 URL".encode(), r.data)
+        self.assertFalse(os.path.exists(os.path.join(app.DATA_DIR, "locks")))
+
+class Retryable(Exception):
+    pass
+
+class Flaky:
+    """errors의 예외를 한 번에 하나씩 내고, 다 쓰면 "ok"를 돌려준다"""
+    def __init__(self, *errors):
+        self.errors, self.calls = list(errors), 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors: raise self.errors.pop(0)
+        return "ok"
+
+def policy(**kwargs):
+    kwargs = {"attempts": 3, "base": 0, "cap": 0, "budget": 100, "threshold": 100, "cooldown": 60, **kwargs}
+    return app.RetryPolicy("test", lambda e: isinstance(e, Retryable), **kwargs)
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_retries_retryable_errors(self):
+        fn = Flaky(Retryable(), Retryable())
+        self.assertEqual(policy().call(fn), "ok")
+        self.assertEqual(fn.calls, 3)
+
+    def test_gives_up_after_attempts(self):
+        fn = Flaky(Retryable(), Retryable(), Retryable())
+        with self.assertRaises(Retryable):
+            policy().call(fn)
+        self.assertEqual(fn.calls, 3)
+
+    def test_does_not_retry_other_errors(self):
+        fn = Flaky(KeyError())
+        with self.assertRaises(KeyError):
+            policy().call(fn)
+        self.assertEqual(fn.calls, 1)
+
+    def test_retry_budget(self):
+        p = policy(budget=1)
+        fn = Flaky(Retryable(), Retryable(), Retryable())
+        with self.assertRaises(Retryable):
+            p.call(fn)
+        self.assertEqual(fn.calls, 2)  # 예산 1번만 재시도
+
+    def test_breaker_opens_and_half_open_probe_closes_it(self):
+        p = policy(attempts=1, threshold=2, cooldown=0.05)
+        for _ in range(2):
+            with self.assertRaises(Retryable):
+                p.call(Flaky(Retryable()))
+        fn = Flaky()
+        with self.assertRaises(app.CircuitOpen):
+            p.call(fn)
+        self.assertEqual(fn.calls, 0)
+        time.sleep(0.06)
+        self.assertEqual(p.call(fn), "ok")
+        self.assertEqual(p.call(fn), "ok")
+
+    def test_failed_half_open_probe_reopens(self):
+        p = policy(attempts=1, threshold=1, cooldown=0.05)
+        with self.assertRaises(Retryable):
+            p.call(Flaky(Retryable()))
+        time.sleep(0.06)
+        with self.assertRaises(Retryable):
+            p.call(Flaky(Retryable()))
+        with self.assertRaises(app.CircuitOpen):
+            p.call(Flaky())
+
+    def test_non_retryable_error_closes_breaker(self):
+        p = policy(attempts=1, threshold=1, cooldown=0.05)
+        with self.assertRaises(Retryable):
+            p.call(Flaky(Retryable()))
+        time.sleep(0.06)
+        with self.assertRaises(KeyError):
+            p.call(Flaky(KeyError()))  # 업스트림은 응답하고 있다
+        self.assertEqual(p.call(Flaky()), "ok")
+
+    def test_acall(self):
+        fn = Flaky(Retryable())
+
+        async def afn():
+            return fn()
+        self.assertEqual(asyncio.run(policy().acall(afn)), "ok")
+        self.assertEqual(fn.calls, 2)
+
+def video(day, views, likes=0, comments=0, duration_sec=60):
+    return {"published": datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=day), "views": views,
+            "likes": likes, "comments": comments, "duration_sec": duration_sec}
+
+class ChannelAggregatesTest(unittest.TestCase):
+    def test_empty(self):
+        agg = app.channel_aggregates([])
+        self.assertEqual(agg["summary"], {})
+        self.assertEqual(agg["top_5"], [])
+        self.assertEqual(set(agg["orders"]), set(app.SORT_KEYS))
+
+    def test_summary(self):
+        videos = [video(0, 1000, likes=20, comments=5, duration_sec=60),
+                  video(14, 3000, likes=40, comments=3, duration_sec=180)]
+        self.assertEqual(app.channel_aggregates(videos)["summary"], {
+            "uploads_per_week": 1.0,
+            "avg_duration": "2분",
+            "likes_per_1000_views": 15.0,
+            "comments_per_1000_views": 2.0,
+        })
+
+    def test_short_span_counts_as_one_week(self):
+        videos = [video(0, 10), video(1, 10), video(2, 10)]
+        self.assertEqual(app.channel_aggregates(videos)["summary"]["uploads_per_week"], 3.0)
+
+    def test_no_views(self):
+        summary = app.channel_aggregates([video(0, 0, likes=3)])["summary"]
+        self.assertEqual(summary["likes_per_1000_views"], 0)
+        self.assertEqual(summary["comments_per_1000_views"], 0)
+
+    def test_orders_and_top_5(self):
+        views = [5, 70, 10, 40, 60, 30, 20]
+        videos = [video(i, v, likes=len(views) - i) for i, v in enumerate(views)]
+        agg = app.channel_aggregates(videos)
+        self.assertEqual(agg["top_5"], [1, 4, 3, 5, 6])
+        self.assertEqual(agg["orders"]["views"], [1, 4, 3, 5, 6, 2, 0])
+        self.assertEqual(agg["orders"]["likes"], list(range(len(views))))
+        self.assertEqual(agg["orders"]["published"], list(reversed(range(len(views)))))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+# tests/test_transcriber.py
+# transcriber.py의 순수 함수 테스트: python -m unittest discover tests
+
+import unittest
+
+import transcriber
+
+def speech(*spans):
+    return [{"start": a, "end": b} for a, b in spans]
+
+class SilenceCutsTest(unittest.TestCase):
+    def test_short_audio_is_not_split(self):
+        self.assertEqual(transcriber.silence_cuts(speech((0, 100)), 150, 100), [])
+
+    def test_cuts_in_the_middle_of_the_nearest_silence(self):
+        # 무음: 80~90(가운데 85), 120~140(가운데 130). 목표 지점 100에 더 가까운 85에서 자른다
+        cuts = transcriber.silence_cuts(speech((0, 80), (90, 120), (140, 230)), 230, 100)
+        self.assertEqual(cuts, [85])
+
+    def test_falls_back_to_target_without_silence(self):
+        self.assertEqual(transcriber.silence_cuts(speech((0, 400)), 400, 100), [100, 200, 300])
+
+    def test_ignores_silence_too_far_from_target(self):
+        # 40은 목표 100의 ±50 밖이다
+        self.assertEqual(transcriber.silence_cuts(speech((0, 30), (50, 240)), 240, 100), [100])
+
+    def test_chunks_follow_previous_cut(self):
+        cuts = transcriber.silence_cuts(speech((0, 90), (100, 210), (220, 500)), 500, 100)
+        self.assertEqual(cuts, [95, 215, 315, 415])
+        for a, b in zip([0, *cuts], [*cuts, 500]):
+            self.assertLessEqual(b - a, 150)  # 마지막 조각도 chunk의 1.5배를 넘지 않는다
+
+if __name__ == "__main__":
+    unittest.main()
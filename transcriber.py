@@ -0,0 +1,249 @@
+# transcriber.py
+# AI 자막 프로세스 풀에서 도는 코드. Flask 앱(app.py)을 import하지 않으므로 풀 프로세스는
+# faster_whisper와 모델만 올린다. 모델은 프로세스마다 한 번 로드해 여러 작업에 재사용한다.
+
+import os
+import time
+import random
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger("transcriber")
+
+class ModelUnavailable(Exception):
+    """Whisper 모델을 로드하지 못해 (또는 재시도 대기 중이라) 지금은 AI 자막을 만들 수 없음"""
+
+class JobCancelled(Exception):
+    """웹 쪽에서 작업을 취소함 (지켜보는 클라이언트가 없어짐)"""
+
+_settings = {}
+
+def init_worker(model_dir, db_path, warm=(), retry_base=30, retry_max=600):
+    """ProcessPoolExecutor initializer. warm에 있는 get_whisper_model 인자들은 백그라운드에서 미리 로드한다."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [transcriber:%(process)d] %(message)s")
+    _settings.update(model_dir=model_dir, db_path=db_path)
+    models.retry_base, models.retry_max = retry_base, retry_max
+    if warm: models.warm(warm)
+
+def ready():
+    """풀 프로세스를 미리 띄우기 위한 빈 작업"""
+    return os.getpid()
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(l.split()[1]) for l in f if l.startswith("VmRSS")) / 1024
+    except (OSError, StopIteration):
+        return None
+
+# --- Whisper 모델 레지스트리 ---
+class ModelRegistry:
+    """프로세스 안의 Whisper 모델들. 같은 모델을 동시에 요청하면 한 번만 로드하고 나머지는 기다린다.
+    로드에 실패하면 지수 백오프 후에 다시 시도하며, 그 사이의 요청은 기다리지 않고 ModelUnavailable을 낸다.
+    모델별 상태/로드 시간/메모리 증가량은 whisper_models 테이블에 기록해 웹 프로세스가 보여 준다."""
+    def __init__(self, retry_base=30, retry_max=600):
+        self.retry_base, self.retry_max = retry_base, retry_max
+        self._lock = threading.Lock()
+        self._models = {}  # (model, compute_type, cpu_threads, num_workers) -> WhisperModel
+        self._loading = {}  # 키 -> threading.Event
+        self._failures = {}  # 키 -> (연속 실패 횟수, 재시도 가능 시각)
+
+    def get(self, model='base', compute_type='int8', cpu_threads=0, num_workers=1):
+        key = (model, compute_type, cpu_threads, num_workers)
+        while True:
+            with self._lock:
+                if key in self._models: return self._models[key]
+                done = self._loading.get(key)
+                if done is None:
+                    attempts, retry_at = self._failures.get(key, (0, 0))
+                    if time.monotonic() < retry_at:
+                        raise ModelUnavailable(f"{model} 로드 재시도 대기 중 ({retry_at - time.monotonic():.0f}초)")
+                    done = self._loading[key] = threading.Event()
+                    break
+            done.wait()  # 다른 스레드(예열)가 로드 중이면 끝나기를 기다렸다가 결과를 다시 본다
+        try:
+            return self._load(key, attempts)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            done.set()
+
+    def _load(self, key, attempts):
+        model, compute_type, cpu_threads, num_workers = key
+        logger.info(f"Whisper 모델을 로드하는 중입니다... ({model}, {compute_type})")
+        self._report(key, "loading", attempts=attempts + 1)
+        started, rss_before = time.monotonic(), rss_mb()
+        try:
+            # Render의 영구 디스크 경로를 사용
+            cache_directory = _settings["model_dir"]
+            os.makedirs(cache_directory, exist_ok=True)
+            from faster_whisper import WhisperModel
+            m = WhisperModel(model, device='cpu', compute_type=compute_type, cpu_threads=cpu_threads,
+                             num_workers=num_workers, download_root=cache_directory)
+        except Exception as e:
+            delay = min(self.retry_max, self.retry_base * 2 ** attempts) * random.uniform(0.5, 1)
+            with self._lock:
+                self._failures[key] = (attempts + 1, time.monotonic() + delay)
+            logger.error(f"Whisper 모델 로드 실패 ({model}, {attempts + 1}회째): {e}, {delay:.0f}초 후 재시도")
+            self._report(key, "error", attempts=attempts + 1, error=str(e)[:500], retry_in=delay)
+            raise ModelUnavailable(str(e)) from e
+        load_sec = time.monotonic() - started
+        rss_after = rss_mb()
+        with self._lock:
+            self._models[key] = m
+            self._failures.pop(key, None)
+        logger.info(f"Whisper 모델 로드 완료. ({model}, {load_sec:.1f}초)")
+        self._report(key, "ready", attempts=attempts + 1, load_sec=load_sec,
+                     mem_mb=rss_after - rss_before if rss_before is not None else None)
+        return m
+
+    def warm(self, keys):
+        """keys의 모델을 백그라운드 스레드에서 로드한다. 실패하면 백오프 시각까지 기다렸다가 성공할 때까지 다시 시도한다."""
+        def run():
+            pending = list(keys)
+            while pending:
+                key = pending.pop(0)
+                try:
+                    self.get(*key)
+                except ModelUnavailable:
+                    pending.append(key)
+                    with self._lock:
+                        wait = min(at for _, at in self._failures.values()) - time.monotonic() if self._failures else 0
+                    time.sleep(max(wait, 1))
+        threading.Thread(target=run, name="whisper-warm", daemon=True).start()
+
+    def _report(self, key, status, attempts=0, load_sec=None, mem_mb=None, error=None, retry_in=None):
+        if not _settings.get("db_path"): return
+        try:
+            with sqlite3.connect(_settings["db_path"], timeout=30) as conn:
+                conn.execute("INSERT OR REPLACE INTO whisper_models VALUES (?,?,?,?,?,?,?,?,?,?)",
+                             (os.getpid(), key[0], key[1], status, attempts, load_sec, mem_mb, error,
+                              time.time() + retry_in if retry_in is not None else None, time.time()))
+        except sqlite3.Error as e:
+            logger.warning(f"모델 상태 기록 실패: {e}")
+
+models = ModelRegistry()
+
+def get_whisper_model(model='base', compute_type='int8', cpu_threads=0, num_workers=1):
+    return models.get(model, compute_type, cpu_threads, num_workers)
+
+# --- SRT ---
+def format_srt_time(sec):
+    return f"{int(sec//3600):02}:{int(sec%3600//60):02}:{int(sec%60):02},{int(sec*1000%1000):03}"
+
+def srt_cue(i, start, end, text):
+    return f"{i+1}\n{format_srt_time(start)} --> {format_srt_time(end)}\n{text.strip()}"
+
+# --- 작업 ---
+class CueWriter:
+    """디코딩된 자막 조각을 transcribe_cues 테이블에 바로 기록해 웹 워커가 스트리밍할 수 있게 한다.
+    세그먼트마다 커밋하면 DB 락이 잦으므로 flush_sec 간격으로 모아서 쓴다. 그때마다 작업이 아직 실행 중인지 보고
+    웹 쪽에서 취소했으면 JobCancelled를 내 디코딩을 멈춘다. write=False면 취소 확인만 한다."""
+    def __init__(self, job_id, flush_sec=1.0, write=True):
+        self.job_id, self.flush_sec, self.write = job_id, flush_sec, write
+        self.pending, self.last_flush = [], time.monotonic()
+        self.conn = sqlite3.connect(_settings["db_path"], timeout=30) if job_id else None
+
+    def add(self, idx, cue):
+        if not self.conn: return
+        if self.write: self.pending.append((self.job_id, idx, cue))
+        if time.monotonic() - self.last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self):
+        if self.conn and self.pending:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO transcribe_cues VALUES (?,?,?)", self.pending)
+            self.pending = []
+        self.last_flush = time.monotonic()
+        if self.conn:
+            row = self.conn.execute("SELECT status FROM transcribe_jobs WHERE id=?", (self.job_id,)).fetchone()
+            if not row or row[0] != 'running':
+                raise JobCancelled(self.job_id)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.conn: self.conn.close()
+
+def iter_segments(audio, model='base', compute_type='int8', language='ko', beam_size=5,
+                  cpu_threads=0, num_workers=1, vad_filter=False, vad_parameters=None, batch_size=0):
+    """audio(파일 경로 또는 16kHz float32 배열)를 전사해 세그먼트를 디코딩되는 대로 돌려준다.
+    vad_filter면 음성 구간만 디코딩한다 (타임스탬프는 원래 오디오 기준으로 돌려준다).
+    vad_filter와 batch_size가 모두 있으면 BatchedInferencePipeline으로 VAD 구간들을 batch_size개씩 묶어 한 번에 디코딩한다.
+    배치 파이프라인은 VAD 구간 없이는 30초가 넘는 오디오를 처리하지 못하므로 VAD를 끄면 순차 디코딩한다."""
+    model = get_whisper_model(model, compute_type, cpu_threads, num_workers)
+    if batch_size and vad_filter:
+        from faster_whisper import BatchedInferencePipeline
+        model = BatchedInferencePipeline(model=model)
+        # 기본값(True)이면 구간마다 자막 하나가 되므로 순차 디코딩처럼 문장 단위 타임스탬프를 받는다
+        kwargs = {"batch_size": batch_size, "without_timestamps": False}
+    else:
+        kwargs = {}
+    segs, info = model.transcribe(audio, beam_size=beam_size, language=language,
+                                  vad_filter=vad_filter, vad_parameters=vad_parameters, **kwargs)
+    if vad_filter and getattr(info, "duration_after_vad", None) is not None:
+        logger.info(f"VAD: {info.duration:.0f}초 중 {info.duration_after_vad:.0f}초만 디코딩")
+    return segs
+
+def transcribe_file(path, job_id=None, **options):
+    """오디오 파일 하나를 받아 SRT 문자열을 돌려준다 (풀 프로세스에서 실행).
+    job_id가 있으면 세그먼트가 디코딩되는 대로 자막 조각을 DB에 기록한다. options는 iter_segments 인자."""
+    cues, writer = [], CueWriter(job_id)
+    try:
+        for i, s in enumerate(iter_segments(path, **options)):
+            cues.append(srt_cue(i, s.start, s.end, s.text))
+            writer.add(i, cues[-1])
+    finally:
+        writer.close()
+    return "\n\n".join(cues)
+
+# --- 긴 영상 분할 전사 ---
+SAMPLE_RATE = 16000  # faster-whisper 입력 샘플레이트
+
+def silence_cuts(speech, total, chunk):
+    """음성 구간(샘플 단위) 사이 무음의 한가운데에서 대략 chunk 샘플마다 자를 지점.
+    목표 지점 ±chunk/2 안에 무음이 없으면 목표 지점에서 그냥 자른다."""
+    gaps = [(a["end"] + b["start"]) // 2 for a, b in zip(speech, speech[1:])]
+    cuts, last = [], 0
+    while total - last > chunk * 3 // 2:  # 마지막 조각이 너무 짧아지지 않게
+        target = last + chunk
+        near = [g for g in gaps if last + chunk // 2 < g < target + chunk // 2]
+        cut = min(near, key=lambda g: abs(g - target)) if near else target
+        cuts.append(cut)
+        last = cut
+    return cuts
+
+def split_audio(path, out_dir, chunk_sec, vad_parameters=None):
+    """오디오를 무음 구간에서 약 chunk_sec초 조각으로 잘라 out_dir에 int16 .npy로 저장한다 (풀 프로세스에서 실행).
+    [(조각 경로, 시작 시각(초)), ...]를 돌려준다."""
+    import numpy as np
+    from faster_whisper import decode_audio
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+    speech = get_speech_timestamps(audio, VadOptions(**(vad_parameters or {})))
+    bounds = [0, *silence_cuts(speech, len(audio), int(chunk_sec * SAMPLE_RATE)), len(audio)]
+    chunks = []
+    for n, (a, b) in enumerate(zip(bounds, bounds[1:])):
+        chunk_path = os.path.join(out_dir, f"chunk{n:03}.npy")
+        np.save(chunk_path, (audio[a:b] * 32767).astype(np.int16))  # float32의 절반 크기
+        chunks.append((chunk_path, a / SAMPLE_RATE))
+    logger.info(f"오디오 분할: {len(audio) / SAMPLE_RATE:.0f}초 → {len(chunks)}조각")
+    return chunks
+
+def transcribe_chunk(path, offset, job_id=None, **options):
+    """split_audio가 만든 조각 하나를 전사해 원래 오디오 기준 시각의 (start, end, text) 목록을 돌려준다.
+    자막 조각 기록은 디스패처가 순서대로 하므로 여기서는 작업 취소 여부만 확인한다."""
+    import numpy as np
+    audio = np.load(path).astype(np.float32) / 32767
+    out, watch = [], CueWriter(job_id, write=False)
+    try:
+        for s in iter_segments(audio, **options):
+            out.append((s.start + offset, s.end + offset, s.text))
+            watch.add(len(out), None)
+    finally:
+        watch.close()
+    return out